@@ -1,14 +1,18 @@
 from datetime import datetime
+from html import escape
 
 from pytz import timezone
 from telebot import TeleBot
 from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from src.worker import Worker
-from src.config import LOCATION_ID_TO_LOCATION_MAPPING, Location, get_available_days, get_available_hours, TIME_ZONE
-from src.database import Reservation
+from src.config import Location, METRICS_PORT, MAX_DURATION
+from src.orgs import OrgProfile, load_orgs, get_org, find_court
+from src.accounts import accounts
+from src.database import Reservation, Attempt
 from src.logger import Logger
 from src.tele_handler import errorsWrapper
+from src import metrics
 import typing
 
 
@@ -28,15 +32,23 @@ class Menu:
     @staticmethod
     def choose_acc_menu():
         markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton("Zafar", callback_data="cred_zafar"))
-        markup.add(InlineKeyboardButton("Mike", callback_data="cred_mike"))
+        for account in accounts:
+            markup.add(InlineKeyboardButton(account.label, callback_data=f"cred_{account.name}"))
         markup.add(InlineKeyboardButton("🔙 Back", callback_data="back.admin"))
         
         return markup
 
     @staticmethod
-    def new_reservation_menu():
-        days = [day.date() for day in get_available_days()]
+    def choose_org_menu():
+        markup = InlineKeyboardMarkup()
+        for org in load_orgs().values():
+            markup.add(InlineKeyboardButton(org.name, callback_data=f"org_{org.org_id}"))
+        markup.add(InlineKeyboardButton("🔙 Back", callback_data="back.acc"))
+        return markup
+
+    @staticmethod
+    def new_reservation_menu(org: OrgProfile):
+        days = [day.date() for day in org.get_available_days()]
         markup = InlineKeyboardMarkup()
         for day in days:
             markup.add(InlineKeyboardButton(day.strftime("%B %d"), callback_data=f"day_{day.strftime('%Y/%m/%d')}"))
@@ -45,18 +57,18 @@ class Menu:
         return markup
 
     @staticmethod
-    def courts_menu():
+    def courts_menu(org: OrgProfile):
         markup = InlineKeyboardMarkup()
-        for location in Location:
-            markup.add(InlineKeyboardButton(location.value, callback_data=f"court_{location.id}"))
+        for court in org.catalog.values():
+            markup.add(InlineKeyboardButton(court.value, callback_data=f"court_{court.id}"))
         
         markup.add(InlineKeyboardButton("🔙 Back", callback_data="back.days"))
         return markup
 
     @staticmethod
-    def new_reservation_hours_menu():
+    def new_reservation_hours_menu(org: OrgProfile, hours: int = 1):
         markup = InlineKeyboardMarkup(row_width=4)
-        all_hours = get_available_hours()
+        all_hours = org.get_available_hours(hours)
         row = []
         for resrvation in all_hours:
             if len(row) == 4:
@@ -68,6 +80,11 @@ class Menu:
         if row:
             markup.row(*row)
 
+        # booked as a single reservation, up to the site's limit
+        markup.row(*(
+            InlineKeyboardButton(f"{'✅ ' if length == hours else ''}{length}h", callback_data=f"length_{length}")
+            for length in range(1, MAX_DURATION // 60 + 1)
+        ))
         markup.add(InlineKeyboardButton("🔙 Back", callback_data="back.courts"))
         return markup
 
@@ -75,8 +92,9 @@ class Menu:
     def view_reservations_menu(reservations: list[Reservation]):
         markup = InlineKeyboardMarkup()
         for n, reservation in enumerate(reservations):
-            court = LOCATION_ID_TO_LOCATION_MAPPING[int(reservation.court_id)].value.split("-")[1].strip()
-            markup.add(InlineKeyboardButton(f"{n+1}. [{reservation.acc}] {court} On {reservation.date.strftime('%B %d %H:%M')}", callback_data=f"rsrv_{reservation.id}"))
+            court = get_org(reservation.org_id).court(reservation.court_id).court_label
+            length = f" ({reservation.duration // 60}h)" if (reservation.duration or 60) > 60 else ""
+            markup.add(InlineKeyboardButton(f"{n+1}. [{reservation.acc}] {court} On {reservation.date.strftime('%B %d %H:%M')}{length}", callback_data=f"rsrv_{reservation.id}"))
 
         markup.add(InlineKeyboardButton("🔙 Back", callback_data="back.admin"))
         return markup
@@ -101,7 +119,8 @@ def back(call):
     menu: typing.Callable
 
     if page == "days":
-        menu = Menu.new_reservation_menu
+        org = get_org(queue.get(call.message.chat.id, {}).get("org"))
+        menu = lambda: Menu.new_reservation_menu(org)
     elif page == "acc":
         menu = Menu.choose_acc_menu
     else:
@@ -120,16 +139,30 @@ def choose_acc(call):
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("cred_"))
 def choose_acc(call):
-    queue.setdefault(call.message.chat.id, {}).update(account=call.data.split("_")[1])
-    bot.edit_message_text("Please select a day", call.message.chat.id, call.message.id, reply_markup=Menu.new_reservation_menu())
+    queue.setdefault(call.message.chat.id, {}).update(account=call.data.split("_", 1)[1])
+    orgs = load_orgs()
+    if len(orgs) > 1:
+        bot.edit_message_text("Please select a club", call.message.chat.id, call.message.id, reply_markup=Menu.choose_org_menu())
+        return
+
+    queue[call.message.chat.id].update(org=next(iter(orgs)))
+    bot.edit_message_text("Please select a day", call.message.chat.id, call.message.id, reply_markup=Menu.new_reservation_menu(get_org()))
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("org_"))
+def choose_org(call):
+    org = get_org(int(call.data.split("_")[1]))
+    queue.setdefault(call.message.chat.id, {}).update(org=org.org_id)
+    bot.edit_message_text(f"Please select a day at {org.name}", call.message.chat.id, call.message.id, reply_markup=Menu.new_reservation_menu(org))
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("day_"))
 def new_reservation_day(call):
     date = datetime.strptime(call.data.split("_")[1], "%Y/%m/%d")
     queue[call.message.chat.id].update(date=date)
+    org = get_org(queue[call.message.chat.id].get("org"))
     
-    bot.edit_message_text(f"Please select a court for {date.strftime('%B %d')}", call.message.chat.id, call.message.id, reply_markup=Menu.courts_menu())
+    bot.edit_message_text(f"Please select a court for {date.strftime('%B %d')}", call.message.chat.id, call.message.id, reply_markup=Menu.courts_menu(org))
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("court_"))
@@ -141,27 +174,42 @@ def new_reservation_court(call):
         return
 
     queue[call.message.chat.id].update(court=court)
-    bot.edit_message_text(f"Please select a time for {date.strftime('%B %d')} at {LOCATION_ID_TO_LOCATION_MAPPING[int(court)].value}", call.message.chat.id, call.message.id, reply_markup=Menu.new_reservation_hours_menu())
+    org = get_org(queue[call.message.chat.id].get("org"))
+    bot.edit_message_text(f"Please select a time for {date.strftime('%B %d')} at {org.court(court).value}", call.message.chat.id, call.message.id, reply_markup=Menu.new_reservation_hours_menu(org))
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("length_"))
+def choose_length(call):
+    hours = int(call.data.split("_")[1])
+    court = queue.get(call.message.chat.id, {}).get("court")
+    if not court:
+        bot.answer_callback_query(call.id, "⚠️ Please select a court first or try again", show_alert=True)
+        return
+
+    org = get_org(queue[call.message.chat.id].get("org"))
+    bot.edit_message_reply_markup(call.message.chat.id, call.message.id, reply_markup=Menu.new_reservation_hours_menu(org, hours))
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("hour_"))
 def book_reservation(call):
     hours = call.data.split("_")[1]
     start, end = map(int, hours.split(":"))
+    duration = (end - start) * 60
     
     acc = queue.get(call.message.chat.id, {}).get("account")
     date = queue.get(call.message.chat.id, {}).get("date")
     court = queue.get(call.message.chat.id, {}).get("court")
+    org = get_org(queue.get(call.message.chat.id, {}).get("org"))
     
     del queue[call.message.chat.id]
 
-    reservation = Reservation(acc=acc, date=date.replace(hour=start, tzinfo=timezone(TIME_ZONE)), court_id=court)
+    reservation = Reservation(acc=acc, date=date.replace(hour=start, tzinfo=timezone(org.time_zone)), court_id=court, org_id=org.org_id, duration=duration)
 
     if not Reservation.add(reservation):
         bot.answer_callback_query(call.id, "⚠️ Reservation already exists", show_alert=True)
         return
 
-    msg = f"✅ Reservation for {LOCATION_ID_TO_LOCATION_MAPPING[int(court)].value} created on {reservation.date.strftime('%B %d %H:%M')}" 
+    msg = f"✅ Reservation for {org.court(court).value} created on {reservation.date.strftime('%B %d %H:%M')}-{end}:00" 
     bot.answer_callback_query(call.id, msg, show_alert=True)
     bot.send_message(call.message.chat.id, msg+"\nThe bot will book the court automatically once it becomes available")
 
@@ -223,7 +271,38 @@ def logs(message):
 @bot.message_handler(commands=["next"])
 @errorsWrapper(logger)
 def next_run(message):
-    bot.send_message(message.chat.id, f"Next run is on {worker.next_run} UTC")
+    bot.send_message(message.chat.id, "\n".join(f"{worker.org.name}: next run is on {worker.next_run}" for worker in workers))
+
+
+@bot.message_handler(commands=["stats"])
+@errorsWrapper(logger)
+def stats(message):
+    args = message.text.split(" ")[1:]
+    days = int(args[0]) if args and args[0].isdigit() else 30
+    report = Attempt.stats(days)
+    if not report["slots"] and not report["shadow"]["runs"]:
+        bot.send_message(message.chat.id, f"No attempts recorded in the last {days} days")
+        return
+
+    ms = lambda v: f"{v:.0f}ms" if v is not None else "-"
+    lines = [f"<b>Attempts in the last {days} days</b>", ""]
+    for row in report["slots"]:
+        court = find_court(row["court_id"]).court_label
+        lines.append(f"{court} {row['hour']}:00 - {row['wins']}/{row['attempts']} won, p50 {ms(row['p50'])}, p90 {ms(row['p90'])}")
+
+    lines += ["", "<b>Win rate by delay index</b>"]
+    lines += [f"#{row['delay_index']}: {row['wins']}/{row['attempts']}" for row in report["delays"]]
+
+    lines += ["", "<b>Common failures</b>"]
+    lines += [escape(f"{n}x {msg or '(empty)'}"[:200]) for msg, n in report["failures"]]
+
+    shadow = report["shadow"]
+    if shadow["runs"]:
+        lines += ["", f"<b>Shadow dry-fires</b> - {shadow['ok']}/{shadow['runs']} OK"]
+        lines += [f"{phase}: p50 {ms(p50)}, p90 {ms(p90)}" for phase, (p50, p90) in shadow["phases"].items()]
+        lines += [escape(msg[:200]) for msg in shadow["failures"]]
+
+    bot.send_message(message.chat.id, "\n".join(lines)[:4096], parse_mode="HTML")
 
 
 @bot.message_handler(commands=["test"])
@@ -235,21 +314,26 @@ def test_reserve(message):
     reservation = Reservation(
         date,
         Location.HARD_TENNIS_1.id,
-        acc="zafar",
-    )
-    resbot = ReserveBot(reservation, logger, bot)
-    resbot.START_HOUR = datetime.now(tz=timezone('UTC')).hour
-    resbot.additional = message.chat.id
-    resbot.reserve_pool(
-        reservation.date,
-        Location.HARD_TENNIS_1,
-        0
+        acc="zafar", # /test makes a real booking: always on this account
     )
+    with ReserveBot(reservation, logger, bot) as resbot:
+        resbot.START_HOUR = datetime.now(tz=timezone('UTC')).hour
+        resbot.additional = message.chat.id
+        resbot.reserve_pool(
+            reservation.date,
+            Location.HARD_TENNIS_1,
+            0
+        )
 
 if __name__ == "__main__":
     logger.info("Starting the bot") 
-    worker = Worker(bot, logger)
-    worker.run()
+    metrics.serve(METRICS_PORT)
+    from src.courtreserve import prelogin
+    from src.threads import threads
+    threads.spawn(prelogin, logger, name="prelogin")
+    workers = Worker.shards(bot, logger, list(load_orgs().values()))
+    for worker in workers:
+        worker.run()
     
     bot.infinity_polling(timeout=10, long_polling_timeout=5)
 
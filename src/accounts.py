@@ -0,0 +1,122 @@
+from glob import glob
+from threading import Lock
+
+from .config import ORG_ID, zafar_details, michael_details
+from .database import CredStates
+
+import json
+import os
+
+
+# accounts that predate the registry; a creds entry can still override any of it
+BUILTIN_LOGINS = {"zafar": CredStates.zafar, "mike": CredStates.mike}
+BUILTIN_MEMBERS = {"zafar": zafar_details, "mike": michael_details}
+PERSON_FIELDS = ("first_name", "last_name", "email")
+
+
+class Account:
+    __slots__ = ("name", "label", "login", "member", "orgs", "cookies")
+
+    def __init__(self, name: str, login: dict, member: dict, cookies: dict, label: str = None, orgs: dict = None):
+        self.name = name
+        self.label = label or name.title()
+        self.login = login # Account/Login form
+        self.member = member # member_id, org_member_id, names, email, membership_number for the booking form at the default club
+        self.orgs = {int(org_id): details for org_id, details in (orgs or {}).items()} # org id -> the same fields at other clubs
+        self.cookies = cookies # static site cookies (ASP.NET_SessionId, ...)
+
+    def __repr__(self):
+        return f"Account(name={self.name})"
+
+    def member_for(self, org_id: int) -> dict:
+        # member ids and membership numbers are issued per club: never reuse the default club's at another one
+        org_id = int(org_id)
+        if org_id in self.orgs:
+            # only the person (names, email) carries over; the ids must come from the club's own entry
+            person = {field: self.member[field] for field in PERSON_FIELDS if field in self.member}
+            return {**person, **self.orgs[org_id]}
+        if org_id == ORG_ID:
+            return self.member
+        raise KeyError(f"Account {self.name} has no member details for org {org_id}")
+
+    def books_at(self, org_id: int) -> bool:
+        return int(org_id) in self.orgs or int(org_id) == ORG_ID
+
+    def secrets(self) -> list:
+        # every member value of every club, for redacting recordings
+        return [value for member in (self.member, *self.orgs.values()) for value in member.values()]
+
+    @staticmethod
+    def from_entry(name: str, entry: dict) -> "Account":
+        entry = dict(entry)
+        login = entry.pop("login", None) or BUILTIN_LOGINS.get(name)
+        member = entry.pop("member", None) or BUILTIN_MEMBERS.get(name)
+        label = entry.pop("label", None)
+        orgs = entry.pop("orgs", None)
+        if not login or not member:
+            raise ValueError(f"Account {name} has no login or member details")
+        return Account(name, login, member, entry, label, orgs)
+
+
+class AccountRegistry:
+    """
+    Accounts from the CREDS env var (a JSON object keyed by account name) or from creds/<name>.json,
+    read on first use. Each entry holds the account's cookies plus optional "login", "member" and "label", and
+    "orgs" ({org id: member fields}) for the member details at clubs other than the default one.
+    """
+
+    def __init__(self, path: str = "creds"):
+        self.path = path
+        self.lock = Lock()
+        self._accounts: dict[str, Account] = None
+        self.errors: dict[str, str] = {}
+
+    def entries(self) -> dict[str, dict]:
+        creds_json = os.getenv("CREDS")
+        if creds_json:
+            try:
+                return json.loads(creds_json)
+            except ValueError:
+                pass
+
+        entries = {}
+        for file in sorted(glob(f"{self.path}/*.json")):
+            with open(file) as f:
+                entries[os.path.splitext(os.path.basename(file))[0]] = json.load(f)
+        return entries
+
+    def load(self) -> dict[str, Account]:
+        with self.lock:
+            if self._accounts is None:
+                accounts, errors = {}, {}
+                for name, entry in self.entries().items():
+                    try:
+                        accounts[name] = Account.from_entry(name, entry)
+                    except ValueError as e:
+                        errors[name] = str(e)
+                self._accounts, self.errors = accounts, errors
+            return self._accounts
+
+    def reload(self):
+        with self.lock:
+            self._accounts = None
+        return self.load()
+
+    def get(self, name: str) -> Account:
+        account = self.load().get(name)
+        if account is None:
+            raise KeyError(self.errors.get(name, f"Unknown account {name}"))
+        return account
+
+    def names(self, org_id: int = None) -> list[str]:
+        # every account, or only those with member details at `org_id`
+        return [name for name, account in self.load().items() if org_id is None or account.books_at(org_id)]
+
+    def __iter__(self):
+        return iter(self.load().values())
+
+    def __len__(self):
+        return len(self.load())
+
+
+accounts = AccountRegistry()
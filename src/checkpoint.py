@@ -0,0 +1,105 @@
+from datetime import datetime
+from threading import RLock, Lock, Event
+from time import sleep
+
+from .planner import reservation_key
+from .threads import threads
+
+import json
+import os
+
+
+class Checkpoint:
+    """
+    On-disk state of the current burst window (plan, won reservations), so a worker restarted
+    by start.sh in the middle of the window can pick up where it crashed.
+
+    Plan changes only mark the state dirty; a background writer saves them at most every `interval`
+    seconds, so the fire path never waits on a JSON dump and an fsync. A win is written right away:
+    losing it in a crash would book the same reservation twice.
+    """
+
+    def __init__(self, window: datetime, path="data/checkpoint.json", interval: float = 0.5, idle: float = 30):
+        self.window = window
+        self.path = path
+        self.state = {"window": window.isoformat(), "plans": {}, "won": []}
+        self.resumed = False
+        self.lock = RLock()
+        self.interval = interval
+        self.idle = idle # the writer exits after this long without changes and comes back on the next one
+        self._dirty = Event()
+        self._writer = None
+        self._write_lock = Lock()
+        self._closed = False
+
+    @staticmethod
+    def load(window: datetime, path="data/checkpoint.json") -> "Checkpoint":
+        # returns the checkpoint for `window`, or a fresh one if the file is missing or belongs to another window
+        checkpoint = Checkpoint(window, path)
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            if state.get("window") == window.isoformat():
+                checkpoint.state.update(state)
+                checkpoint.resumed = True
+        except (OSError, ValueError):
+            pass
+        return checkpoint
+
+    def save(self):
+        # snapshot under the state lock, write outside it
+        with self.lock:
+            data = json.dumps(self.state)
+        with self._write_lock:
+            if self._closed:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+    def _changed(self):
+        # called with self.lock held
+        self._dirty.set()
+        if self._writer is None and not self._closed:
+            self._writer = threads.spawn(self._run, name="checkpoint-writer")
+
+    def _run(self):
+        while not self._closed:
+            if self._dirty.wait(self.idle):
+                self._dirty.clear()
+                self.save()
+                sleep(self.interval)
+                continue
+            with self.lock:
+                if not self._dirty.is_set():
+                    self._writer = None
+                    return
+
+    def clear(self):
+        with self._write_lock:
+            self._closed = True
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self._dirty.set() # let the writer see it's done
+
+    reservation_key = staticmethod(reservation_key)
+
+    def set_plan(self, reservation, candidates: list[tuple[datetime, int]]):
+        with self.lock:
+            self.state["plans"][self.reservation_key(reservation)] = [(date.isoformat(), court_id) for date, court_id in candidates]
+            self._changed()
+
+    def mark_won(self, reservation):
+        # once per reservation, so it can afford the synchronous write
+        with self.lock:
+            self.state["won"].append(self.reservation_key(reservation))
+        self.save()
+
+    def is_won(self, reservation) -> bool:
+        return self.reservation_key(reservation) in self.state["won"]
@@ -2,10 +2,22 @@ from datetime import datetime, time, timedelta
 from pytz import timezone
 from enum import Enum
 import json
+import os
 
 # UTC Timezone
 TIME_ZONE = "UTC"
 START_HOUR = 11 # 11 AM UTC
+BURST_WINDOW = timedelta(minutes=10) # how long after START_HOUR a restarted worker still resumes the burst
+SCHEDULER_WORKERS = 16 # global cap on concurrent requests/tasks across all accounts
+SCHEDULER_RESERVED = 4 # of those, kept for POSTs due at their fire time so a pile of form fetches can't delay them
+METRICS_PORT = 9100 # localhost only: /metrics, /healthz, /readyz
+WATCH_BUDGET = 30 # requests per account per hour while watching for cancellations
+WATCH_INTERVAL = (60, 900) # (tightest, loosest) seconds between polls of a watched reservation
+WATCH_TOKEN_AGE = 600 # rebuild a watched booking's form tokens after this many seconds
+SHADOW_TIME = os.getenv("COURTRESERVE_SHADOW_TIME", "09:00") # daily dry-fire (HH:MM, org time zone); empty to turn it off
+RECORD_PATH = os.getenv("COURTRESERVE_RECORD") # e.g. data/requests.jsonl; appends every ReserveBot exchange (redacted)
+REPLAY_PATH = os.getenv("COURTRESERVE_REPLAY") # serve ReserveBot from a recording instead of the live site
+MAX_DURATION = 180 # minutes; the site refuses longer bookings ("restricted to 180 minutes")
 
 ORG_ID = 12207
 OPEN, CLOSE = (7, 21) # (7 AM, 9 PM)
@@ -21,17 +33,22 @@ class Location(Enum):
     PICKLEBALL_2A = "Pickleball - Pickleball 2A"
     PICKLEBALL_2B = "Pickleball - Pickleball 2B"
 
+    # all static, looked up from COURT_CATALOG which is built once at import
     @property
     def id(self) -> int:
-        return LOCATION_NAME_TO_ID_MAPPING[self.value]
+        return COURT_CATALOG[self].id
 
     @property
     def court_type(self) -> str:
-        return self.value.split(" - ")[1].split(" ")[0] # Pickleball/Tennis
+        return COURT_CATALOG[self].type # Pickleball/Tennis
 
     @property
     def court_label(self) -> str:
-        return self.value.split(" - ")[1]
+        return COURT_CATALOG[self].label
+
+    @property
+    def siblings(self) -> tuple["Location", ...]:
+        return COURT_CATALOG[self].siblings
     
 
 LOCATION_NAME_TO_ID_MAPPING = {
@@ -46,6 +63,38 @@ LOCATION_NAME_TO_ID_MAPPING = {
 LOCATION_ID_TO_LOCATION_MAPPING = {v: Location(k) for k, v in LOCATION_NAME_TO_ID_MAPPING.items()}
 
 
+class Court:
+    __slots__ = ("location", "id", "type", "label", "group", "siblings")
+
+    def __init__(self, location: Location, id: int, type: str, label: str, group: str):
+        self.location = location
+        self.id = id
+        self.type = type
+        self.label = label
+        self.group = group # courts sharing a group are each other's plan B
+        self.siblings: tuple[Location, ...] = ()
+
+    def __repr__(self):
+        return f"Court(id={self.id}, label={self.label})"
+
+
+def build_court_catalog() -> dict[Location, Court]:
+    catalog = {}
+    for location in Location:
+        label = location.value.split(" - ")[1]
+        # 'Pickleball 1A' -> 'Pickleball 1', 'Tennis Court #2' -> 'Tennis Court #'
+        catalog[location] = Court(location, LOCATION_NAME_TO_ID_MAPPING[location.value], label.split(" ")[0], label, label[:-1])
+
+    for court in catalog.values():
+        group = [other.location for other in catalog.values() if other.group == court.group and other is not court]
+        same_type = [other.location for other in catalog.values() if other.type == court.type and other is not court and other.location not in group]
+        court.siblings = tuple(group + same_type)
+    return catalog
+
+
+COURT_CATALOG = build_court_catalog()
+
+
 zafar_details = {
     'member_id': '5663355',
     'org_member_id': '4442712',
@@ -93,16 +142,7 @@ def planB_court(court: Location, date: datetime) -> list[tuple[datetime, Locatio
 
     from itertools import product
     dates = [date, date + timedelta(hours=1)]
-    courts = [court]
-    court_type = court.court_type
-    
-    while len(courts) < 2:
-        for _court in Location:
-            if _court.court_type == court_type and _court != court:
-                courts.append(_court)
-                break
-    
-    print(list(product(dates, courts)))
+    courts = [court, *court.siblings[:1]]
     return list(product(dates, courts))
 
 
@@ -114,3 +154,7 @@ def load_credentials(acc):
 class ExceededReservationTime(Exception):
     pass
 
+
+class RequestFailed(Exception):
+    pass
+
@@ -1,66 +1,78 @@
-from datetime import datetime, time, timedelta
-from time import sleep
+from datetime import datetime, timedelta
+from threading import Thread
+from time import sleep, perf_counter
 from traceback import format_exc
-from urllib.parse import unquote
+from urllib.parse import unquote, urlsplit
 
 from bs4 import BeautifulSoup
 from pytz import timezone
-from requests import Session
+from requests import Session, Request
+from requests.adapters import HTTPAdapter
 from telebot import TeleBot
 
-from .database import Reservation, CredStates
+from .database import Reservation, CredStates, Attempt
 from .logger import Logger
-from concurrent.futures import ThreadPoolExecutor
+from .scheduler import scheduler, wait_all, FIRE, FALLBACK, HOUSEKEEPING
 
-from .config import LOCATION_ID_TO_LOCATION_MAPPING, START_HOUR, TIME_ZONE, Location
-from .config import zafar_details, michael_details
-from .config import load_credentials, planB_court
-from .config import ExceededReservationTime
+from .config import Location
+from .config import ExceededReservationTime, RequestFailed, SCHEDULER_WORKERS, RECORD_PATH, REPLAY_PATH
+from .forms import ReservationTemplate, CREATE_RESERVATION_URL, CREATE_RESERVATION_PARAMS, CREATE_RESERVATION_HEADERS
+from .transport import Transport, RequestPolicy, PREPARE_POLICY, LOGIN_POLICY, FIRE_POLICY
+from .slots import claims, slot_keys, SlotClaims
+from .planner import Candidate, CandidatePlan, reservation_key, minutes, slots
+from .replay import Recorder, ReplayAdapter
+from .orgs import OrgProfile, DEFAULT_ORG, get_org
+from .accounts import Account, accounts
+from .metrics import registry
 
 
-class ReserveBot:
-    def __init__(self, reservation: Reservation, logger: Logger, bot: TeleBot):
-        self.session  = Session()
-        self.reservation = reservation
+SESSIONS = registry.gauge("courtreserve_sessions", "ReserveBot sessions created and not closed")
+WARM_CONNECTIONS = registry.gauge("courtreserve_warm_connections", "Sessions with a warmed connection to the reservations host")
+PHASE_LATENCY = registry.histogram("courtreserve_phase_seconds", "Per-phase latency of reserve attempts", ("phase",), (.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300))
 
-        self.acc = reservation.acc
-        if reservation.acc == "zafar":
-            self.member_details = zafar_details
-        elif reservation.acc == "mike":
-            self.member_details = michael_details
-        self.creds: dict = load_credentials(reservation.acc)
 
-
-        self.zone = timezone(TIME_ZONE)
+class AccountSession:
+    # logged-in session of one account on one club; ReserveBot builds on it, prelogin uses it alone
+    def __init__(self, account: Account, org: OrgProfile, logger: Logger):
+        self.session  = Session()
+        # keep a connection per concurrent POST alive instead of reconnecting during the burst
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=SCHEDULER_WORKERS))
+        if REPLAY_PATH:
+            ReplayAdapter(REPLAY_PATH).mount(self.session)
+        if RECORD_PATH:
+            Recorder(RECORD_PATH, label=account.name, secrets=account.secrets()).attach(self.session)
+        self.transport = Transport(self.session, logger)
+        self.warmed = False
+        self.closed = False
+        SESSIONS.inc()
+        self.account = account
+        self.acc = account.name
+        self.org = org
+        self.creds: dict = dict(account.cookies)
         self.logger = logger
-        self.bot = bot
 
-        self.is_reserved = False
+    def close(self):
+        # releases the pooled connections; safe to call more than once
+        if self.closed:
+            return
+        self.closed = True
+        self.session.close()
+        SESSIONS.dec()
+        if self.warmed:
+            WARM_CONNECTIONS.dec()
 
-        self.START_HOUR = START_HOUR
-        self.additional = None
-        self.setup()
-        self.logger.info(f"Initialized Session for {self.acc}", True)
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc):
+        self.close()
 
-    def _get(self, url, *args, **kwargs):
-        res = None
-        try:
-            res = self.session.get(url, *args, **kwargs)
-            res.raise_for_status()
-            return res
-        except Exception:
-            self.logger.error(format_exc())
+    def _get(self, url, params=None, policy: RequestPolicy = PREPARE_POLICY, trace: dict = None, **kwargs):
+        return self.transport.request("GET", url, policy, trace, params=params, **kwargs)
     
-    def _post(self, url, *args, **kwargs):
-        res = None
-        try:
-            self.logger.info(f"POST {url}", True)
-            res = self.session.post(url, *args, **kwargs)
-            res.raise_for_status()
-            return res
-        except Exception:
-            self.logger.error(format_exc())
+    def _post(self, url, params=None, data=None, policy: RequestPolicy = FIRE_POLICY, trace: dict = None, **kwargs):
+        self.logger.info(f"POST {url}", True)
+        return self.transport.request("POST", url, policy, trace, params=params, data=data, **kwargs)
 
     def _setup(self):
         headers = {
@@ -82,17 +94,18 @@ class ReserveBot:
 
         self.session.headers.update(headers)
 
-    def get_creds(self, force_login: bool):
+    def get_creds(self, force_login: bool) -> dict:
         creds = CredStates.get(self.acc)
         if not creds or force_login:
-            data: dict = getattr(CredStates, self.acc)
-            x = self._post('https://app.courtreserve.com/Account/Login', data=data)
+            x = self._post('https://app.courtreserve.com/Account/Login', data=self.account.login, policy=LOGIN_POLICY)
+            if x is None or not x.history:
+                raise RequestFailed(f"Login failed for {self.acc}")
             application_code = x.history[0].cookies.get_dict()['.AspNet.ApplicationCookie']
             CredStates.update(self.acc, cred:={".AspNet.ApplicationCookie": application_code})
             self.logger.info(f"Logging in {self.acc}", True)
             return cred
 
-        return creds
+        return creds.data
 
     def setup(self, force_login=False):
         self._setup()
@@ -100,27 +113,67 @@ class ReserveBot:
         self.creds.update(login_creds)
         self.session.cookies.update(self.creds)
 
-        res = self._get('https://app.courtreserve.com/Online/Reservations/Index/12207')
+        res = self._get(self.org.index_url)
+        if res is None:
+            raise RequestFailed(f"Could not load the reservations page for {self.acc}")
         if 'login' in res.text and not force_login:
             return self.setup(force_login=True)
 
         return unquote(res.text.split("OrganizationMemberFavoriteApi")[1].split("requestData=")[1].split("&")[0]).strip()
 
+
+class ReserveBot(AccountSession):
+    def __init__(self, reservation: Reservation, logger: Logger, bot: TeleBot):
+        account, org = accounts.get(reservation.acc), get_org(reservation.org_id)
+        # before the session is opened: an account without details at this club fails without leaking it
+        member_details = account.member_for(org.org_id)
+        super().__init__(account, org, logger)
+        self.reservation = reservation
+
+        self.owner = reservation_key(reservation) # claim owner in the slot table
+        self.member_details = member_details
+        self.template = ReservationTemplate(self.member_details, self.org.org_id, self.org.membership_id, self.org.reservation_type_id)
+        self.create_reservation_api = CREATE_RESERVATION_URL.format(org_id=self.org.org_id)
+
+        self.zone = timezone(self.org.time_zone)
+        self.bot = bot
+
+        self.is_reserved = False
+        self.mode = "burst" # attempt history tag: burst / watch / shadow
+
+        self.START_HOUR = self.org.release_hour
+        self.additional = None
+        self.claims: SlotClaims = claims # the worker hands each org shard its own table
+        self.checkpoint = None
+        self.plan: CandidatePlan = None
+        self.pending = []
+        self.fanout = 1 # POSTs that can be in flight together, one warmed connection each
+        try:
+            self.setup()
+        except Exception:
+            self.close()
+            raise
+        self.logger.info(f"Initialized Session for {self.acc}", True)
+
     def create_reservation_url(self, start: str, end: str, court_label: str):
         params = (
             ('start', start),
             ('end', end),
             ('courtLabel', court_label),
             ('customSchedulerId', ''),
-            ('returnUrlStartPage', 'https://app.courtreserve.com//Online/Reservations/Index/12207'),
+            ('returnUrlStartPage', self.org.index_url),
         )
 
-        res = self._get('https://app.courtreserve.com/Online/Reservations/CreateReservationCourtsView/12207', params=params)
+        res = self._get(self.org.courts_view_url, params=params)
+        if res is None:
+            return None
         self.logger.info(res.url, True)
         return res.text.split("ixUrl('")[1].split("')")[0].replace("&amp;", "&")
 
     def create_reservation(self, url):
         res = self._get(url)
+        if res is None:
+            return None
         soup = BeautifulSoup(res.text, "html.parser")
 
         if "restricted to 180 minute" in soup.text.lower():
@@ -142,98 +195,23 @@ class ReserveBot:
             "RequestData": soup.find("input", {"name": "RequestData"}).get("value"),
         }
 
-    def reserve_court(self, member: dict, keys: dict, date: str, court_type: str, start_time: str, is_today: bool, court_id: str, delay: int):
-        # date = '5/24/2024 12:00:00 AM'
-        # court_type = 'Pickleball - Pickleball 2A'
-        # start_time = '12:00:00'
-
-        params = (
-            ('uiCulture', 'en-US'),
-        )
-
-        data = [
-            ('__RequestVerificationToken', keys["__RequestVerificationToken"]),
-            ('Id', '12207'),
-            ('OrgId', '12207'),
-            ('MemberId', member["member_id"]),
-            ('IsConsolidatedScheduler', 'False'),
-            ('HoldTimeForReservation', '15'),
-            ('RequirePaymentWhenBookingCourtsOnline', 'False'),
-            ('AllowMemberToPickOtherMembersToPlayWith', 'False'),
-            ('ReservableEntityName', 'Court'),
-            ('IsAllowedToPickStartAndEndTime', 'False'),
-            ('CustomSchedulerId', ''),
-            ('CustomSchedulerId', ''),
-            ('IsConsolidated', 'False'),
-            ('IsToday', str(is_today)),
-            ('IsFromDynamicSlots', 'False'),
-            ('InstructorId', ''),
-            ('InstructorName', ''),
-            ('CanSelectCourt', 'False'),
-            ('IsCourtRequired', 'False'),
-            ('CostTypeAllowOpenMatches', 'False'),
-            ('IsMultipleCourtRequired', 'False'),
-            ('ReservationQueueId', ''),
-            ('ReservationQueueSlotId', ''),
-            ('RequestData', keys["RequestData"]),
-            ('Date', date),
-            ('SelectedCourtType', court_type),
-            ('SelectedCourtTypeId', '0'),
-            ('SelectedResourceId', ''),
-            ('DisclosureText', ''),
-            ('DisclosureName', ''),
-            ('IsResourceReservation', 'False'),
-            ('StartTime', start_time),
-            ('CourtTypeEnum', '9'),
-            ('MembershipId', '115054'),
-            ('UseMinTimeByDefault', 'False'),
-            ('IsEligibleForPreauthorization', 'False'),
-            ('MatchMakerSelectedRatingIdsString', ''),
-            ('DurationType', ''),
-            ('MaxAllowedCourtsPerReservation', '1'),
-            ('SelectedResourceName', ''),
-            ('ReservationTypeId', '60221'),
-            ('Duration', '60'),
-            ('CourtId', court_id), # the court type id ig
-            ('OwnersDropdown_input', ''),
-            ('OwnersDropdown', ''),
-            ('SelectedMembers[0].OrgMemberId', member["org_member_id"]),
-            ('SelectedMembers[0].MemberId', member["member_id"]),
-            ('SelectedMembers[0].OrgMemberFamilyId', ''),
-            ('SelectedMembers[0].FirstName', member['first_name']),
-            ('SelectedMembers[0].LastName', member['last_name']),
-            ('SelectedMembers[0].Email', member['email']),
-            ('SelectedMembers[0].MembershipNumber', member['membership_number']),
-            ('SelectedMembers[0].PaidAmt', ''),
-            ('SelectedNumberOfGuests', ''),
-            ('X-Requested-With', 'XMLHttpRequest'),
-        ]
-
+    def wait_for_trigger(self, delay: float):
         # make sure this function is called 15mins max before the reservation time
-        self.logger.info(f"[WAITING] - {datetime.now(tz=self.zone)} waiting for new reservations for {self.acc} on {date}", True)
         while True:
             dtnow = datetime.now(tz=self.zone)
             if dtnow.hour == self.START_HOUR:
                 break
             sleep(0.005)
 
-        if self.is_reserved:
-            return {"isValid": False, "message": "Already reserved", "terminated_by_bot": True}
-
         # sleep for the artificial delay to prioritize the first reservation
         sleep(delay)
 
-        self.logger.info(f"[{datetime.now(tz=self.zone)}] Reserving {date} for {self.acc}", True)
-        res = self._post('https://reservations.courtreserve.com//Online/ReservationsApi/CreateReservation/12207', params=params, data=data)
-        return res.json() # check for isValid = True
-
-
-    def reserve(self, date: datetime, court: Location, delay: int):
-        # date = '5/24/2024 12:00:00 AM'
-
-        # court_type = 'Pickleball - Pickleball 2A' or 'Hard - Tennis Court #2
-        # start_time = '12:00:00'
+    def trigger_time(self) -> float:
+        # epoch seconds of the release; now if the window has already started
+        now = datetime.now(tz=self.zone)
+        return max(now.replace(hour=self.START_HOUR, minute=0, second=0, microsecond=0).timestamp(), now.timestamp())
 
+    def prepare(self, date: datetime, court: Location, trace: dict = None, candidate: Candidate = None) -> dict:
         # create_reservation_url params:
         # start: 'Fri May 24 2024 12:00:00 GMT 0300 (GMT 03:00)'
         # end: 'Fri May 24 2024 13:00:00 GMT 0300 (GMT 03:00)'
@@ -243,46 +221,186 @@ class ReserveBot:
         # `court_label` is the second part of the court_type above
         # that's it
 
-        _date = date.strftime("%m/%d/%Y %H:%M:%S %p")
-        start = date.strftime("%a %b %d %Y %H:%M:%S GMT 0300 (GMT 03:00)")
-        end = (date + timedelta(hours=1)).strftime("%a %b %d %Y %H:%M:%S GMT 0300 (GMT 03:00)")
-        
-        is_today = date.date() == datetime.now(tz=self.zone).date()
+        # returns the ready-to-send request under "request", or an isValid=False result when the form can't be loaded
 
-        court_label = court.court_label
-        court_type = court.value
-        court_id = str(court.id)
+        candidate = candidate or Candidate(date, court, minutes(self.reservation))
+        if self.claims.is_blocked(slot_keys(court, date, candidate.duration), self.owner):
+            # another account holds it: don't spend the form and token requests on it
+            return {"isValid": False, "message": "Slot claimed by another account", "terminated_by_bot": True}
+        _date = candidate.form_date
+        is_today = date.date() == datetime.now(tz=self.zone).date()
 
-        url = self.create_reservation_url(start, end, court_label)
+        trace = trace if trace is not None else {}
+        started = perf_counter()
+        url = self.create_reservation_url(candidate.start, candidate.end, candidate.court_label)
+        trace["url_ms"] = (perf_counter() - started) * 1000
+        if url is None:
+            return {"isValid": False, "message": "Could not open the reservation form"}
         try:
+            started = perf_counter()
             keys = self.create_reservation(url)
+            trace["token_ms"] = (perf_counter() - started) * 1000
         except ExceededReservationTime:
             return {"isValid": False, "message": "Reservation restricted to 180 minutes"}
+        if keys is None:
+            return {"isValid": False, "message": "Could not load the reservation tokens"}
+
+        body = self.template.render(keys, _date, candidate.court_type, _date.split(" ")[1], is_today, candidate.court_id, candidate.duration)
+        request = Request("POST", self.create_reservation_api, params=CREATE_RESERVATION_PARAMS, data=body, headers=CREATE_RESERVATION_HEADERS)
+        self.warm_up(trace)
+        return {
+            "request": self.session.prepare_request(request),
+            "date": _date,
+            "slots": slot_keys(court, date, candidate.duration),
+        }
+
+    def warm_up(self, trace: dict = None):
+        # open `fanout` TLS connections to the reservations host before the trigger, so no POST of the
+        # first round connects after it; concurrent HEADs, a sequential one would reuse the same connection
+        if self.warmed:
+            return
+        self.warmed = True
+        host = urlsplit(self.create_reservation_api)
+        url = f"{host.scheme}://{host.netloc}/"
+        opened = []
+
+        def _head():
+            try:
+                self.session.head(url, timeout=5)
+                opened.append(True)
+            except Exception:
+                pass
+
+        started = perf_counter()
+        heads = [Thread(target=_head, daemon=True) for _ in range(self.fanout - 1)]
+        for head in heads:
+            head.start()
+        _head()
+        for head in heads:
+            head.join()
+        if not opened:
+            self.warmed = False
+            return
+        if trace is not None:
+            trace["warm_ms"] = (perf_counter() - started) * 1000
+        WARM_CONNECTIONS.inc()
+
+    def fire(self, prepared: dict, trace: dict = None) -> dict:
+        trace = trace if trace is not None else {}
+        if self.is_reserved:
+            return {"isValid": False, "message": "Already reserved", "terminated_by_bot": True}
 
-        reservation = self.reserve_court(self.member_details, keys, _date, court_type, _date.split(" ")[1], is_today, court_id, delay)
-        return reservation
+        if self.claims.is_blocked(prepared["slots"], self.owner):
+            return {"isValid": False, "message": "Slot claimed by another account", "terminated_by_bot": True}
+
+        posting = perf_counter()
+        request = prepared["request"].copy()
+        # the cookies as of now: the session may have logged in again since prepare(), and watch mode reuses requests
+        request.headers.pop("Cookie", None)
+        request.prepare_cookies(self.session.cookies)
+        res = self.transport.send(request, FIRE_POLICY, trace)
+        trace["post_ms"] = (perf_counter() - posting) * 1000
+        self.logger.info(f"[{datetime.now(tz=self.zone)}] CreateReservation for {prepared['date']} ({self.acc}) answered in {trace['post_ms']:.0f}ms", True)
+        if res is None:
+            return {"isValid": False, "message": f"CreateReservation failed (HTTP {trace.get('status', '-')})"}
+        return res.json() # check for isValid = True
 
+    def reserve(self, date: datetime, court: Location, delay: int, trace: dict = None):
+        trace = trace if trace is not None else {}
+        prepared = self.prepare(date, court, trace)
+        if "request" not in prepared:
+            return prepared
+
+        self.logger.info(f"[WAITING] - {datetime.now(tz=self.zone)} waiting for new reservations for {self.acc} on {prepared['date']}", True)
+        waiting = perf_counter()
+        self.wait_for_trigger(delay)
+        trace["wait_ms"] = (perf_counter() - waiting) * 1000
+        return self.fire(prepared, trace)
+
+
+    def record(self, court_date: datetime, court: Location, index: int, trace: dict, resrv: dict):
+        for phase in ("login", "url", "token", "warm", "wait", "post"):
+            if f"{phase}_ms" in trace:
+                PHASE_LATENCY.observe(trace[f"{phase}_ms"] / 1000, phase=phase)
+        Attempt.record(
+            acc=self.acc, court_id=court.id, slot=court_date, delay_index=index, mode=self.mode,
+            message=resrv.get("message", ""), success=bool(resrv.get("isValid")), **trace
+        )
 
-    def reserve_pool(self, court_date: datetime, court: Location, delay: int):
+    def handle_result(self, court_date: datetime, court: Location, index: int, trace: dict, resrv: dict):
+        if resrv and "terminated_by_bot" not in resrv:
+            self.record(court_date, court, index, trace, resrv)
+        if self.is_reserved: return
+
+        if resrv and resrv["isValid"] and "terminated_by_bot" not in resrv:
+            self.is_reserved = True
+            self.claims.book(slot_keys(court, court_date, minutes(self.reservation)), self.owner)
+            if self.checkpoint:
+                self.checkpoint.mark_won(self.reservation)
+            msg = f"✅ [{self.reservation.acc}] Succesfully reserved {self.reservation.date} at {court.court_label}"
+            scheduler.submit(self.bot.send_message, 6874076639, msg, priority=HOUSEKEEPING)
+            scheduler.submit(self.bot.send_message, 942683545, msg, priority=HOUSEKEEPING) # notify the dev/ delete after testing
+            scheduler.submit(Reservation.delete, self.reservation, priority=HOUSEKEEPING)
+            # drop the attempts still waiting for their fire time
+            for future in list(self.pending):
+                future.cancel()
+        else:
+            if "terminated_by_bot" in resrv: return
+            self.logger.warning(f"[{self.reservation.acc}] Error while reserving {self.reservation.date} at {court.court_label}:\n{resrv.get('message', '')}", additional=self.additional)
+
+    def attempt(self, court_date: datetime, court: Location, index: int, trace: dict, func):
         try:
-            if self.is_reserved: return
-            resrv = self.reserve(date=court_date, court=court, delay=delay)
-            if self.is_reserved: return
-
-            if resrv and resrv["isValid"] and "terminated_by_bot" not in resrv:
-                self.is_reserved = True
-                self.bot.send_message(6874076639, f"✅ [{self.reservation.acc}] Succesfully reserved {self.reservation.date} at {court.court_label}")
-                self.bot.send_message(942683545, f"✅ [{self.reservation.acc}] Succesfully reserved {self.reservation.date} at {court.court_label}") # notify the dev/ delete after testing
-                try:
-                    Reservation.delete(self.reservation)
-                except:
-                    pass
-            else:
-                if "terminated_by_bot" in resrv: return
-                self.logger.warning(f"[{self.reservation.acc}] Error while reserving {self.reservation.date} at {court.court_label}:\n{resrv.get('message', '')}", additional=self.additional)
-        except Exception:
+            resrv = func()
+            if resrv is not None:
+                self.handle_result(court_date, court, index, trace, resrv)
+        except Exception as e:
+            self.record(court_date, court, index, trace, {"message": f"{type(e).__name__}: {e}"})
             self.logger.error(format_exc())
 
+    def reserve_pool(self, court_date: datetime, court: Location, delay: int, index: int = None):
+        # blocking prepare -> wait -> fire in the caller's thread (used by /test)
+        if self.is_reserved: return
+        trace = {}
+        self.attempt(court_date, court, index, trace, lambda: self.reserve(date=court_date, court=court, delay=delay, trace=trace))
+
+    def schedule_attempt(self, candidate: Candidate, fire_at: float, priority: int, index: int = None):
+        # prepares right away and leaves the POST on the shared scheduler for `fire_at`
+        if self.is_reserved: return
+        court_date, court = candidate
+        trace = {}
+
+        def _prepare():
+            prepared = self.prepare(court_date, court, trace, candidate)
+            if "request" not in prepared:
+                return prepared
+            waiting = perf_counter()
+
+            def _fire():
+                trace["wait_ms"] = (perf_counter() - waiting) * 1000
+                return self.fire(prepared, trace)
+
+            future = scheduler.submit(self.attempt, court_date, court, index, trace, _fire, priority=priority, account=self.acc, at=fire_at)
+            self.pending.append(future)
+            if self.is_reserved:
+                # won while this one was preparing, after handle_result cancelled the rest
+                future.cancel()
+
+        self.attempt(court_date, court, index, trace, _prepare)
+
+
+    def candidates(self) -> list[Candidate]:
+        # checkpointed plan (after a restart) > the worker's precomputed plan > planB_court
+        plan = self.checkpoint.state["plans"].get(self.owner) if self.checkpoint else None
+        if plan:
+            return [Candidate(datetime.fromisoformat(date), self.org.court(court_id), minutes(self.reservation)) for date, court_id in plan]
+
+        candidates = self.plan.candidates(self.owner) if self.plan else []
+        if not candidates:
+            candidates = [Candidate(date, court, minutes(self.reservation)) for date, court in slots(self.reservation, self.org.court(self.reservation.court_id))]
+        if self.checkpoint:
+            self.checkpoint.set_plan(self.reservation, [(date, court.id) for date, court in candidates])
+        return candidates
+
 
     def reserve_worker(self, now: datetime):
         self.logger.info(f"Reserving {self.reservation.date} for {self.reservation.acc}", True)
@@ -291,23 +409,68 @@ class ReserveBot:
             self.logger.info(f"Deleted reservation {self.reservation.date}", True)
             return
 
-        if self.reservation.date.date() != (now + timedelta(days=2)).date():
-            self.logger.info(f"Skipping reservation {self.reservation.date} because it's not two days in advance", True)
+        if self.reservation.date.date() != (now + timedelta(days=self.org.horizon_days)).date():
+            self.logger.info(f"Skipping reservation {self.reservation.date} because it's not {self.org.horizon_days} days in advance", True)
+            return
+
+        if self.checkpoint and self.checkpoint.is_won(self.reservation):
+            # won before a restart; only the cleanup is left
+            self.is_reserved = True
+            Reservation.delete(self.reservation)
+            self.logger.info(f"[{self.reservation.acc}] {self.reservation.date} was already reserved before the restart", True)
             return
 
         delay_gen = lambda x: (2*x**2 +4*x+10)/35
-        with ThreadPoolExecutor(max_workers=7, thread_name_prefix="reservation-wise") as executor:
-            delay = 0; x=0
-            for _ in range(7):
-                for court_date, court in planB_court(LOCATION_ID_TO_LOCATION_MAPPING[int(self.reservation.court_id)], self.reservation.date):
-                    executor.submit(self.reserve_pool, court_date, court, delay)
-                    delay += delay_gen(x); x+=1
-
-        if self.is_reserved is False:
+        candidates = self.candidates()
+        # the first round fires every candidate within a second or two of each other
+        self.fanout = max(1, min(len(candidates), SCHEDULER_WORKERS))
+        trigger = self.trigger_time()
+        delay = 0; x=0
+        for n in range(7):
+            # the first pass over the candidates outranks the repetitions
+            priority = FIRE if n == 0 else FALLBACK
+            for candidate in self.claims.order(self.owner, candidates):
+                self.pending.append(scheduler.submit(self.schedule_attempt, candidate, trigger + delay, priority, x, priority=priority, account=self.acc))
+                delay += delay_gen(x); x+=1
+
+    def finish(self) -> bool:
+        # blocks until every attempt queued by reserve_worker has fired; True if they all missed
+        wait_all(self.pending)
+        missed = bool(self.pending) and self.is_reserved is False
+        if missed:
             self.logger.warning(f"[{self.reservation.acc}] Failed to reserve {self.reservation.date}")
+        self.pending = []
+        return missed
 
 
 
+def prelogin(logger: Logger, names: list[str] = None, org: OrgProfile = DEFAULT_ORG) -> dict[str, str]:
+    # signs every account that books at `org` in (cached cookie if it still works, fresh login otherwise) at the same time,
+    # so the ReserveBots built for the burst find a valid CredStates entry; returns {account: error} for the failures
+    def _check(account: Account):
+        with AccountSession(account, org, logger) as session:
+            session.setup()
+
+    futures = {}
+    for name in names if names is not None else accounts.names(org.org_id):
+        try:
+            # right before the burst: ahead of notifications and other housekeeping
+            futures[name] = scheduler.submit(_check, accounts.get(name), priority=FALLBACK, account=name)
+        except KeyError as e:
+            futures[name] = e
+    wait_all([future for future in futures.values() if not isinstance(future, Exception)])
+
+    failed = {}
+    for name, future in futures.items():
+        error = future if isinstance(future, Exception) else future.exception()
+        if error is not None:
+            failed[name] = f"{type(error).__name__}: {error}"
+    for name, error in failed.items():
+        logger.warning(f"[{name}] account check failed: {error}")
+    logger.info(f"Signed in {len(futures) - len(failed)}/{len(futures)} account(s)", True)
+    return failed
+
+
 if __name__ == "__main__":
     reservation = Reservation(
         datetime(2024, 6, 24, 13, tzinfo=timezone("UTC")),
@@ -1,18 +1,26 @@
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, JSON
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, JSON, Float, Boolean, Index, func, case, event, text, inspect
 from sqlalchemy.orm import Session, scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 from src.logger import Logger
+from src.config import ORG_ID, MAX_DURATION
+from src.metrics import registry, health
+from src.threads import threads
 from datetime import datetime
-from threading import RLock, Thread
+from datetime import timedelta
+from threading import RLock, Event
+from queue import Queue, Empty
+from time import perf_counter
 
 import os
 import json
 
 Base = declarative_base()
 
+QUERY_LATENCY = registry.histogram("courtreserve_db_query_seconds", "SQL statement latency", ("statement",))
+
 class Reservation(Base):
     __tablename__ = 'reservations'
 
@@ -21,8 +29,10 @@ class Reservation(Base):
     court_id = Column(String, nullable=False)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     acc = Column(String, nullable=True)
+    org_id = Column(Integer, nullable=True, default=ORG_ID)
+    duration = Column(Integer, nullable=True, default=60) # minutes, booked in one CreateReservation
 
-    def __init__(self, date: datetime, court_id: str, created_at: datetime = None, acc: str = None):
+    def __init__(self, date: datetime, court_id: str, created_at: datetime = None, acc: str = None, org_id: int = None, duration: int = 60):
         if isinstance(date, str):
             date = datetime.fromisoformat(date)
 
@@ -32,20 +42,27 @@ class Reservation(Base):
         if isinstance(created_at, str):
             created_at = datetime.fromisoformat(created_at)
 
+        if not 0 < duration <= MAX_DURATION:
+            raise ValueError(f"Duration must be between 1 and {MAX_DURATION} minutes")
+
         self.date = date
         self.court_id = court_id
         self.created_at = created_at or datetime.utcnow()
         self.acc = acc
+        self.org_id = org_id or ORG_ID
+        self.duration = duration
 
     def __repr__(self):
-        return f"Reservation(date={self.date}, court_id={self.court_id}, created_at={self.created_at}, acc={self.acc})"
+        return f"Reservation(date={self.date}, court_id={self.court_id}, created_at={self.created_at}, acc={self.acc}, org_id={self.org_id}, duration={self.duration})"
 
     def to_dict(self):
         return {
             "date": self.date.isoformat(),
             "court_id": self.court_id,
             "created_at": self.created_at.isoformat(),
-            "acc": self.acc
+            "acc": self.acc,
+            "org_id": self.org_id,
+            "duration": self.duration
         }
 
     @staticmethod
@@ -79,7 +96,8 @@ class Reservation(Base):
                 session.query(Reservation).filter(
                     Reservation.date == reservation.date,
                     Reservation.court_id == reservation.court_id,
-                    Reservation.acc == reservation.acc
+                    Reservation.acc == reservation.acc,
+                    Reservation.duration == reservation.duration
                 ).delete()
 
 class CredStates(Base):
@@ -130,6 +148,172 @@ class CredStates(Base):
             if obj:
                 obj.data = data
                 obj.age = datetime.now()
+            else:
+                session.add(CredStates(acc, data))
+
+class Attempt(Base):
+    # append-only history of every reserve attempt: the burst, cancellation watch polls and shadow dry-fires
+    __tablename__ = 'attempts'
+    __table_args__ = (
+        Index('ix_attempts_court_hour', 'court_id', 'hour'),
+        Index('ix_attempts_created_at', 'created_at'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    acc = Column(String, nullable=True)
+    court_id = Column(String, nullable=False)
+    slot = Column(DateTime, nullable=False)
+    hour = Column(Integer, nullable=False)
+    delay_index = Column(Integer, nullable=True)
+    mode = Column(String, nullable=True, default="burst") # burst / watch / shadow
+    login_ms = Column(Float, nullable=True)
+    url_ms = Column(Float, nullable=True)
+    token_ms = Column(Float, nullable=True)
+    wait_ms = Column(Float, nullable=True)
+    post_ms = Column(Float, nullable=True)
+    warm_ms = Column(Float, nullable=True)
+    status = Column(Integer, nullable=True)
+    message = Column(String, nullable=True)
+    success = Column(Boolean, nullable=False, default=False)
+
+    def __init__(self, acc: str, court_id, slot: datetime, delay_index: int = None, url_ms: float = None, token_ms: float = None,
+                 wait_ms: float = None, post_ms: float = None, status: int = None, message: str = None, success: bool = False,
+                 created_at: datetime = None, mode: str = "burst", login_ms: float = None, warm_ms: float = None):
+        self.acc = acc
+        self.court_id = str(court_id)
+        self.slot = slot
+        self.hour = slot.hour
+        self.delay_index = delay_index
+        self.mode = mode
+        self.login_ms = login_ms
+        self.url_ms = url_ms
+        self.token_ms = token_ms
+        self.wait_ms = wait_ms
+        self.post_ms = post_ms
+        self.warm_ms = warm_ms
+        self.status = status
+        self.message = (message or "")[:500]
+        self.success = success
+        self.created_at = created_at or datetime.utcnow()
+
+    def __repr__(self):
+        return f"Attempt(acc={self.acc}, court_id={self.court_id}, slot={self.slot}, success={self.success})"
+
+    @staticmethod
+    def record(**kwargs):
+        # never touches the database on the caller's thread
+        attempts.put(Attempt(**kwargs))
+
+    @staticmethod
+    def burst():
+        # filter for the release burst's fires (rows from before the mode column included):
+        # off-peak watch polls and shadow dry-fires would skew hit rates and latencies
+        return (Attempt.mode == None) | (Attempt.mode == "burst")
+
+    @staticmethod
+    def stats(days: int = 30) -> dict:
+        since = datetime.utcnow() - timedelta(days=days)
+        real = Attempt.burst()
+        with db.session() as session:
+            by_slot = session.query(
+                Attempt.court_id, Attempt.hour,
+                func.count(Attempt.id), func.sum(case((Attempt.success == True, 1), else_=0))
+            ).filter(Attempt.created_at >= since, real).group_by(Attempt.court_id, Attempt.hour).order_by(Attempt.court_id, Attempt.hour).all()
+
+            by_delay = session.query(
+                Attempt.delay_index, func.count(Attempt.id), func.sum(case((Attempt.success == True, 1), else_=0))
+            ).filter(Attempt.created_at >= since, real).group_by(Attempt.delay_index).order_by(Attempt.delay_index).all()
+
+            failures = session.query(
+                Attempt.message, func.count(Attempt.id).label("n")
+            ).filter(Attempt.created_at >= since, real, Attempt.success == False).group_by(Attempt.message).order_by(func.count(Attempt.id).desc()).limit(5).all()
+
+            latencies = {}
+            for court_id, hour, post_ms in session.query(Attempt.court_id, Attempt.hour, Attempt.post_ms).filter(
+                Attempt.created_at >= since, real, Attempt.post_ms != None
+            ).order_by(Attempt.court_id, Attempt.hour, Attempt.post_ms):
+                latencies.setdefault((court_id, hour), []).append(post_ms)
+
+            shadow = session.query(
+                Attempt.login_ms, Attempt.url_ms, Attempt.token_ms, Attempt.warm_ms, Attempt.success, Attempt.message
+            ).filter(Attempt.created_at >= since, Attempt.mode == "shadow").all()
+
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+        return {
+            "slots": [
+                {"court_id": court_id, "hour": hour, "attempts": n, "wins": wins or 0,
+                 "p50": percentile(latencies.get((court_id, hour)), .5), "p90": percentile(latencies.get((court_id, hour)), .9)}
+                for court_id, hour, n, wins in by_slot
+            ],
+            "delays": [{"delay_index": idx, "attempts": n, "wins": wins or 0} for idx, n, wins in by_delay],
+            "failures": [(message, n) for message, n in failures],
+            "shadow": {
+                "runs": len(shadow),
+                "ok": sum(1 for row in shadow if row.success),
+                "phases": {
+                    phase: (percentile(values, .5), percentile(values, .9))
+                    for phase in ("login", "url", "token", "warm")
+                    if (values := sorted(getattr(row, f"{phase}_ms") for row in shadow if getattr(row, f"{phase}_ms") is not None))
+                },
+                "failures": sorted({row.message for row in shadow if not row.success and row.message})[:5],
+            },
+        }
+
+
+class AttemptWriter:
+    """
+    Buffers attempts in memory and writes them in batches from a background thread,
+    so recording an attempt costs a queue put on the burst path.
+    """
+
+    def __init__(self, batch_size=50, interval=2.0):
+        self.queue: Queue = Queue()
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop = Event()
+        self._thread = None
+
+    def put(self, attempt: "Attempt"):
+        self.queue.put(attempt)
+        if self._thread is None:
+            self.start()
+
+    def start(self):
+        with db.lock:
+            if self._thread is None:
+                self._thread = threads.spawn(self._run, name="attempt-writer")
+
+    def _drain(self) -> list["Attempt"]:
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.interval))
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except Empty:
+            pass
+        return batch
+
+    def flush(self, batch: list["Attempt"] = None):
+        batch = batch if batch is not None else self._drain()
+        if batch:
+            with db.session() as session:
+                session.add_all(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.flush()
+
+    def stop(self):
+        self._stop.set()
+        while not self.queue.empty():
+            self.flush()
+
+
+attempts = AttemptWriter()
+
 
 def load_credentials(acc):
     # Try to load from environment variable first
@@ -150,29 +334,72 @@ class Database:
         os.makedirs("data", exist_ok=True)
         self.engine = create_engine(uri, pool_size=50, max_overflow=15)
         self.SessionMaker = sessionmaker(bind=self.engine, expire_on_commit=False, autocommit=False, autoflush=False)
+        self.Session = scoped_session(self.SessionMaker) # one thread-local registry for the whole process
 
         self.logger = Logger('database')
         self.lock = RLock()
 
+        event.listen(self.engine, "before_cursor_execute", self._before_execute)
+        event.listen(self.engine, "after_cursor_execute", self._after_execute)
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        QUERY_LATENCY.observe(perf_counter() - started, statement=statement.split(" ", 1)[0].upper())
+
+    def ping(self) -> bool:
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+
     @contextmanager
     def session(self):
         """
         Creates a context with an open SQLAlchemy session.
+
+        Sessions come from the shared thread-local registry; a nested context reuses the outer
+        session and leaves commit/cleanup to it.
         """
+        nested = self.Session.registry.has()
+        session: Session = self.Session()
         try:
-            session: Session = scoped_session(self.SessionMaker)
             yield session
-            session.commit()
+            if not nested:
+                session.commit()
         except Exception as _e:
+            if nested:
+                raise
             from traceback import format_exc
             self.logger.error(f"Database error: {format_exc()}")
             session.rollback()
         finally:
-            session.close()
+            if not nested:
+                self.Session.remove()
 
     def create_database(self):
         Base.metadata.create_all(self.engine)
+        self.migrate()
+
+    def migrate(self):
+        # create_all doesn't touch existing tables: add the columns introduced since the table was created
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                existing = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(self.engine.dialect)}"
+                    if column.default is not None and column.default.is_scalar:
+                        ddl += f" DEFAULT {column.default.arg!r}"
+                    conn.execute(text(ddl))
+                    self.logger.info(f"Added column {table.name}.{column.name}")
 
 
 db = Database()
 db.create_database()
+health.register("database", db.ping)
@@ -0,0 +1,181 @@
+from urllib.parse import quote_plus, urlencode
+
+
+CREATE_RESERVATION_URL = 'https://reservations.courtreserve.com//Online/ReservationsApi/CreateReservation/{org_id}'
+CREATE_RESERVATION_PARAMS = (
+    ('uiCulture', 'en-US'),
+)
+CREATE_RESERVATION_HEADERS = {
+    'content-type': 'application/x-www-form-urlencoded; charset=UTF-8',
+}
+
+
+def reservation_form(member: dict, keys: dict, date: str, court_type: str, start_time: str, is_today: bool, court_id: str,
+                     org_id: str = '12207', membership_id: str = '115054', reservation_type_id: str = '60221', duration: int = 60) -> list:
+    # date = '5/24/2024 12:00:00 AM'
+    # court_type = 'Pickleball - Pickleball 2A'
+    # start_time = '12:00:00'
+    # duration = minutes, up to 180
+    # org_id/membership_id/reservation_type_id come from the club's OrgProfile
+
+    data = [
+        ('__RequestVerificationToken', keys["__RequestVerificationToken"]),
+        ('Id', str(org_id)),
+        ('OrgId', str(org_id)),
+        ('MemberId', member["member_id"]),
+        ('IsConsolidatedScheduler', 'False'),
+        ('HoldTimeForReservation', '15'),
+        ('RequirePaymentWhenBookingCourtsOnline', 'False'),
+        ('AllowMemberToPickOtherMembersToPlayWith', 'False'),
+        ('ReservableEntityName', 'Court'),
+        ('IsAllowedToPickStartAndEndTime', 'False'),
+        ('CustomSchedulerId', ''),
+        ('CustomSchedulerId', ''),
+        ('IsConsolidated', 'False'),
+        ('IsToday', str(is_today)),
+        ('IsFromDynamicSlots', 'False'),
+        ('InstructorId', ''),
+        ('InstructorName', ''),
+        ('CanSelectCourt', 'False'),
+        ('IsCourtRequired', 'False'),
+        ('CostTypeAllowOpenMatches', 'False'),
+        ('IsMultipleCourtRequired', 'False'),
+        ('ReservationQueueId', ''),
+        ('ReservationQueueSlotId', ''),
+        ('RequestData', keys["RequestData"]),
+        ('Date', date),
+        ('SelectedCourtType', court_type),
+        ('SelectedCourtTypeId', '0'),
+        ('SelectedResourceId', ''),
+        ('DisclosureText', ''),
+        ('DisclosureName', ''),
+        ('IsResourceReservation', 'False'),
+        ('StartTime', start_time),
+        ('CourtTypeEnum', '9'),
+        ('MembershipId', membership_id),
+        ('UseMinTimeByDefault', 'False'),
+        ('IsEligibleForPreauthorization', 'False'),
+        ('MatchMakerSelectedRatingIdsString', ''),
+        ('DurationType', ''),
+        ('MaxAllowedCourtsPerReservation', '1'),
+        ('SelectedResourceName', ''),
+        ('ReservationTypeId', reservation_type_id),
+        ('Duration', str(duration)),
+        ('CourtId', court_id), # the court type id ig
+        ('OwnersDropdown_input', ''),
+        ('OwnersDropdown', ''),
+        ('SelectedMembers[0].OrgMemberId', member["org_member_id"]),
+        ('SelectedMembers[0].MemberId', member["member_id"]),
+        ('SelectedMembers[0].OrgMemberFamilyId', ''),
+        ('SelectedMembers[0].FirstName', member['first_name']),
+        ('SelectedMembers[0].LastName', member['last_name']),
+        ('SelectedMembers[0].Email', member['email']),
+        ('SelectedMembers[0].MembershipNumber', member['membership_number']),
+        ('SelectedMembers[0].PaidAmt', ''),
+        ('SelectedNumberOfGuests', ''),
+        ('X-Requested-With', 'XMLHttpRequest'),
+    ]
+    return data
+
+
+class ReservationTemplate:
+    """
+    CreateReservation body compiled once per member and club: the static fields are url-encoded up front
+    and render() only quotes the handful of per-candidate values and joins bytes.
+    """
+
+    FIELDS = ("__RequestVerificationToken", "RequestData", "date", "court_type", "start_time", "is_today", "court_id", "duration")
+
+    def __init__(self, member: dict, org_id: str = '12207', membership_id: str = '115054', reservation_type_id: str = '60221'):
+        # run the real form builder with sentinels to find where the per-candidate values go
+        sentinels = {name: f"\x00{name}\x00" for name in self.FIELDS}
+        lookup = {value: name for name, value in sentinels.items()}
+        keys = {name: sentinels[name] for name in ("__RequestVerificationToken", "RequestData")}
+        fields = reservation_form(member, keys, sentinels["date"], sentinels["court_type"], sentinels["start_time"], sentinels["is_today"], sentinels["court_id"],
+                                  org_id, membership_id, reservation_type_id, sentinels["duration"])
+
+        self.segments: list = [] # pre-encoded bytes or the name of a per-candidate value
+        static = ""
+        for i, (name, value) in enumerate(fields):
+            static += ("&" if i else "") + quote_plus(name) + "="
+            if value in lookup:
+                self.segments += [static.encode(), lookup[value]]
+                static = ""
+            else:
+                static += quote_plus(str(value))
+        if static:
+            self.segments.append(static.encode())
+
+    def render(self, keys: dict, date: str, court_type: str, start_time: str, is_today: bool, court_id: str, duration: int = 60) -> bytes:
+        values = dict(keys, date=date, court_type=court_type, start_time=start_time, is_today=is_today, court_id=court_id, duration=duration)
+        return b"".join(
+            segment if isinstance(segment, bytes) else quote_plus(str(values[segment])).encode()
+            for segment in self.segments
+        )
+
+
+if __name__ == "__main__":
+    # micro-benchmark: trigger -> bytes on the wire for the old path (build the form list, let requests
+    # encode and prepare it after the trigger) vs sending a request prepared from the template.
+    # Runs against a local keep-alive server that timestamps when the body has arrived,
+    # so only our own CPU time differs between the two.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from socket import IPPROTO_TCP, TCP_NODELAY
+    from statistics import median
+    from threading import Thread
+    from time import perf_counter
+
+    from requests import Request, Session
+
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            self.request.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            received.append(perf_counter())
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/Online/ReservationsApi/CreateReservation/12207"
+
+    member = {
+        'member_id': '5663355', 'org_member_id': '4442712', 'first_name': 'First', 'last_name': 'Last',
+        'email': 'member@example.com', 'membership_number': '1138'
+    }
+    keys = {"__RequestVerificationToken": "x" * 150, "RequestData": "y" * 400}
+    args = ("5/24/2024 12:00:00 PM", "Pickleball - Pickleball 2A", "12:00:00", False, "46168")
+
+    session = Session()
+    session.post(url, data=b"warm")
+    template = ReservationTemplate(member)
+    assert template.render(keys, *args) == urlencode(reservation_form(member, keys, *args)).encode()
+
+    def legacy():
+        trigger = perf_counter()
+        session.post(url, params=CREATE_RESERVATION_PARAMS, data=reservation_form(member, keys, *args))
+        return received[-1] - trigger
+
+    def compiled():
+        prepared = session.prepare_request(Request("POST", url, params=CREATE_RESERVATION_PARAMS, data=template.render(keys, *args), headers=CREATE_RESERVATION_HEADERS))
+        trigger = perf_counter()
+        session.send(prepared)
+        return received[-1] - trigger
+
+    for name, func in (("legacy", legacy), ("compiled", compiled)):
+        samples = sorted(func() for _ in range(1000))
+        print(f"{name:>9}: trigger -> body received median {median(samples) * 1e6:.0f}us  p90 {samples[int(len(samples) * .9)] * 1e6:.0f}us")
+
+    server.shutdown()
@@ -1,16 +1,71 @@
 import logging.handlers
-from threading import Thread
+from queue import Queue, Full
+from threading import Lock
 import os
 from telebot import TeleBot
 
 import rich.logging
 
+from .metrics import registry
+from .threads import threads
+
+
+NOTIFICATIONS = registry.gauge("courtreserve_notifications_pending", "Telegram notifications not sent yet")
+DROPPED = registry.counter("courtreserve_notifications_dropped_total", "Telegram notifications dropped because the queue was full")
+
+
+class Notifier:
+    """
+    One TeleBot and a fixed number of sender threads for the whole process; notifications beyond
+    `maxsize` waiting ones are dropped (they're still in the log file).
+    """
+
+    def __init__(self, token: str, senders: int = 2, maxsize: int = 500):
+        self.token = token
+        self.senders = senders
+        self.queue: Queue = Queue(maxsize)
+        self.bot: TeleBot = None
+        self.lock = Lock()
+
+    def start(self):
+        # first notification creates the bot and the senders
+        with self.lock:
+            if self.bot is None:
+                self.bot = TeleBot(self.token)
+                for n in range(self.senders):
+                    threads.spawn(self._run, name=f"notifier-{n}")
+
+    def send(self, recv, message: str):
+        if self.bot is None:
+            self.start()
+        try:
+            self.queue.put_nowait((recv, message))
+            NOTIFICATIONS.inc()
+        except Full:
+            DROPPED.inc()
+
+    def _run(self):
+        while True:
+            recv, message = self.queue.get()
+            try:
+                self.bot.send_message(recv, message, parse_mode="HTML")
+            except Exception:
+                pass
+            finally:
+                NOTIFICATIONS.dec()
+
+
+notifier = Notifier("7021449655:AAGt6LG48rqtV6nCefane06878wJLYynCvk")
+
 
 class Logger:
     def __init__(self, logging_service, max_size=int(3e6)):
         self.logger = logging.getLogger(f"{logging_service}_logger")
         self.logger.setLevel(logging.DEBUG)
         self.logger.propagate = False
+        if self.logger.handlers:
+            # same service logged from several places: reuse its handlers instead of opening the file again
+            return
         
         formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
@@ -32,7 +87,6 @@ class Logger:
             getattr(self.logger, level)(message)
 
         if notification:
-            bot = TeleBot("7021449655:AAGt6LG48rqtV6nCefane06878wJLYynCvk")
             message = message[:4096]
             cc = [942683545]
             if (recvs:=kwargs.get('additional')):
@@ -40,7 +94,7 @@ class Logger:
                 cc = list(set(cc))            
 
             for recv in cc:
-                Thread(target=bot.send_message, args=(recv, message,), kwargs={"parse_mode": "HTML"}).start()
+                notifier.send(recv, message)
 
     def info(self, message, notification=False, **kwargs):
         self._log(message, "info", notification,**kwargs)
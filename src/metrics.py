@@ -0,0 +1,214 @@
+from threading import Lock, active_count
+
+import os
+
+
+class Metric:
+    # values are keyed by label tuples; the lock only guards a dict update so it's never held for long
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str = "", labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+        self.lock = Lock()
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def format_labels(self, key: tuple, extra: dict = None) -> str:
+        pairs = list(zip(self.labels, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in list(self.values.items()):
+            lines.append(f"{self.name}{self.format_labels(key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self.key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+    BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, help: str = "", labels: tuple = (), buckets: tuple = BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2) # buckets..., +Inf, sum
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, counts in list(self.values.items()):
+            counts = list(counts)
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{self.format_labels(key, {'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{self.format_labels(key, {'le': '+Inf'})} {counts[-2]}")
+            lines.append(f"{self.name}_count{self.format_labels(key)} {counts[-2]}")
+            lines.append(f"{self.name}_sum{self.format_labels(key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.lock = Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str = "", labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str = "", labels: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str = "", labels: tuple = (), buckets: tuple = Histogram.BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class Health:
+    # named checks returning True/False; /healthz runs the liveness ones, /readyz all of them
+    def __init__(self):
+        self.checks: dict = {}
+        self.live: set = set()
+
+    def register(self, name: str, check, live: bool = False):
+        self.checks[name] = check
+        if live:
+            self.live.add(name)
+
+    def run(self, live_only: bool = False) -> dict:
+        results = {}
+        for name, check in list(self.checks.items()):
+            if live_only and name not in self.live:
+                continue
+            try:
+                results[name] = bool(check())
+            except Exception:
+                results[name] = False
+        return results
+
+
+health = Health()
+collectors: list = [] # called before every scrape to refresh gauges that are cheaper to read than to track
+
+THREADS = registry.gauge("courtreserve_threads", "Live threads in the process")
+OPEN_FDS = registry.gauge("courtreserve_open_fds", "Open file descriptors")
+OPEN_SOCKETS = registry.gauge("courtreserve_open_sockets", "Open sockets")
+MEMORY = registry.gauge("courtreserve_memory_rss_bytes", "Resident memory")
+
+
+def resources() -> dict:
+    # threads, fds, sockets and RSS of this process; fds/sockets/RSS come from /proc and are None elsewhere
+    fds = sockets = rss = None
+    try:
+        links = []
+        for fd in os.listdir("/proc/self/fd"):
+            try:
+                links.append(os.readlink(f"/proc/self/fd/{fd}"))
+            except OSError:
+                pass
+        fds, sockets = len(links), sum(1 for link in links if link.startswith("socket:"))
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    return {"threads": active_count(), "fds": fds, "sockets": sockets, "rss": rss}
+
+
+def _collect_resources():
+    usage = resources()
+    THREADS.set(usage["threads"])
+    for gauge, key in ((OPEN_FDS, "fds"), (OPEN_SOCKETS, "sockets"), (MEMORY, "rss")):
+        if usage[key] is not None:
+            gauge.set(usage[key])
+
+collectors.append(_collect_resources)
+
+
+def serve(port: int, host: str = "127.0.0.1"):
+    """
+    Serves /metrics (Prometheus text format), /healthz and /readyz from a daemon thread.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from .threads import threads
+    import json
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body: str, content_type: str = "text/plain; version=0.0.4"):
+            data = body.encode()
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                for collect in list(collectors):
+                    try:
+                        collect()
+                    except Exception:
+                        pass
+                self._reply(200, registry.render())
+            elif self.path in ("/healthz", "/readyz"):
+                results = health.run(live_only=self.path == "/healthz")
+                self._reply(200 if all(results.values()) else 503, json.dumps(results) + "\n", "application/json")
+            else:
+                self._reply(404, "not found\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threads.spawn(server.serve_forever, name="metrics-server")
+    return server
@@ -0,0 +1,143 @@
+from datetime import datetime, time, timedelta
+from glob import glob
+from pytz import timezone
+
+import json
+import os
+
+from .config import ORG_ID, START_HOUR, OPEN, CLOSE, TIME_ZONE, LOCATION_NAME_TO_ID_MAPPING, LOCATION_ID_TO_LOCATION_MAPPING
+
+
+class OrgCourt:
+    # same surface as config.Location, for the courts of clubs other than the default one
+    __slots__ = ("id", "value", "court_label", "court_type", "group", "siblings")
+
+    def __init__(self, id: int, value: str):
+        self.id = id
+        self.value = value # 'Pickleball - Pickleball 1A'
+        self.court_label = value.split(" - ")[1]
+        self.court_type = self.court_label.split(" ")[0]
+        self.group = self.court_label[:-1]
+        self.siblings: tuple["OrgCourt", ...] = ()
+
+    def __repr__(self):
+        return f"OrgCourt(id={self.id}, label={self.court_label})"
+
+
+class OrgProfile:
+    """
+    Everything that differs between clubs: ids baked into the booking form, the courts,
+    when the next day's slots are released and how far ahead they are.
+    """
+
+    def __init__(self, org_id: int, name: str, courts: dict[str, int] = None, release_hour: int = START_HOUR, horizon_days: int = 2,
+                 membership_id: str = "115054", reservation_type_id: str = "60221", open: int = OPEN, close: int = CLOSE,
+                 time_zone: str = TIME_ZONE):
+        self.org_id = int(org_id)
+        self.name = name
+        self.courts = courts # court name -> court id; None to use the cached catalog
+        self.release_hour = release_hour
+        self.horizon_days = horizon_days
+        self.membership_id = str(membership_id)
+        self.reservation_type_id = str(reservation_type_id)
+        self.open = open
+        self.close = close
+        self.time_zone = time_zone
+        self._catalog: dict = None
+
+    def __repr__(self):
+        return f"OrgProfile(org_id={self.org_id}, name={self.name})"
+
+    @staticmethod
+    def from_dict(data: dict) -> "OrgProfile":
+        return OrgProfile(**data)
+
+    @property
+    def catalog_path(self) -> str:
+        return f"data/orgs/{self.org_id}.json"
+
+    def load_courts(self) -> dict[str, int]:
+        # courts from the profile are written to the catalog cache, later starts (or profiles without courts) read it back
+        if self.courts:
+            os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+            tmp = f"{self.catalog_path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.courts, f)
+            os.replace(tmp, self.catalog_path)
+            return self.courts
+
+        with open(self.catalog_path) as f:
+            self.courts = json.load(f)
+        return self.courts
+
+    @property
+    def catalog(self) -> dict:
+        # court id -> court, resolved once per process
+        if self._catalog is None:
+            if self.org_id == ORG_ID and self.courts == LOCATION_NAME_TO_ID_MAPPING:
+                self._catalog = dict(LOCATION_ID_TO_LOCATION_MAPPING)
+            else:
+                courts = [OrgCourt(int(court_id), name) for name, court_id in self.load_courts().items()]
+                for court in courts:
+                    group = [other for other in courts if other.group == court.group and other is not court]
+                    same_type = [other for other in courts if other.court_type == court.court_type and other is not court and other not in group]
+                    court.siblings = tuple(group + same_type)
+                self._catalog = {court.id: court for court in courts}
+        return self._catalog
+
+    def court(self, court_id):
+        return self.catalog[int(court_id)]
+
+    def get_available_days(self, now: datetime = None) -> list[datetime]:
+        # same rule as config.get_available_days, with this club's release hour and horizon
+        now = now or datetime.now(timezone(self.time_zone))
+        days = []
+        if now.hour < self.release_hour:
+            days.append(now + timedelta(days=self.horizon_days))
+        days.append(now + timedelta(days=self.horizon_days + 1))
+        days.append(now + timedelta(days=self.horizon_days + 2))
+        return days
+
+    def get_available_hours(self, hours: int = 1) -> list[tuple[time, time]]:
+        # (start, end) of every `hours` long booking that ends by the last slot
+        return [(time(hour, 0), time(hour+hours, 0)) for hour in range(self.open, self.close + 2 - hours)]
+
+    @property
+    def index_url(self) -> str:
+        return f"https://app.courtreserve.com/Online/Reservations/Index/{self.org_id}"
+
+    @property
+    def courts_view_url(self) -> str:
+        return f"https://app.courtreserve.com/Online/Reservations/CreateReservationCourtsView/{self.org_id}"
+
+
+DEFAULT_ORG = OrgProfile(ORG_ID, "Default", LOCATION_NAME_TO_ID_MAPPING)
+
+_orgs: dict[int, OrgProfile] = None
+
+def load_orgs(path: str = "orgs") -> dict[int, OrgProfile]:
+    # default club + one profile per orgs/<name>.json, read once
+    global _orgs
+    if _orgs is None:
+        orgs = {DEFAULT_ORG.org_id: DEFAULT_ORG}
+        for file in sorted(glob(f"{path}/*.json")):
+            with open(file) as f:
+                org = OrgProfile.from_dict(json.load(f))
+            orgs[org.org_id] = org
+        _orgs = orgs
+    return _orgs
+
+def get_org(org_id: int = None) -> OrgProfile:
+    # no id means the default club; an id without a profile is an error, not the default club's form
+    org = load_orgs().get(int(org_id or ORG_ID))
+    if org is None:
+        raise KeyError(f"Unknown org {org_id}")
+    return org
+
+def find_court(court_id):
+    # court ids are unique across clubs; used where only the id is known (attempt history)
+    for org in load_orgs().values():
+        court = org.catalog.get(int(court_id))
+        if court is not None:
+            return court
+    raise KeyError(court_id)
@@ -0,0 +1,116 @@
+from array import array
+from datetime import datetime, timedelta
+
+from pytz import timezone
+
+from .config import Location, planB_court
+from .database import Reservation
+from .orgs import OrgProfile, DEFAULT_ORG
+
+
+class Candidate:
+    # one (slot, court) to fire at, with every string the form needs already rendered
+    __slots__ = ("date", "court", "duration", "court_id", "court_label", "court_type", "form_date", "start", "end")
+
+    def __init__(self, date: datetime, court: Location, duration: int = 60):
+        self.date = date
+        self.court = court
+        self.duration = duration # minutes
+        self.court_id = str(court.id)
+        self.court_label = court.court_label
+        self.court_type = court.value
+        # date = '5/24/2024 12:00:00 AM'
+        # start/end: 'Fri May 24 2024 12:00:00 GMT 0300 (GMT 03:00)'
+        self.form_date = date.strftime("%m/%d/%Y %H:%M:%S %p")
+        self.start = date.strftime("%a %b %d %Y %H:%M:%S GMT 0300 (GMT 03:00)")
+        self.end = (date + timedelta(minutes=duration)).strftime("%a %b %d %Y %H:%M:%S GMT 0300 (GMT 03:00)")
+
+    def __iter__(self):
+        # unpacks like the (date, court) tuples of planB_court
+        return iter((self.date, self.court))
+
+    def __repr__(self):
+        return f"Candidate({self.date}, {self.court_label}, {self.duration}min)"
+
+
+class CandidatePlan:
+    """
+    Candidate table for every due reservation, built in one pass before the burst.
+
+    Rows are stored back to back; `offsets[i]:offsets[i+1]` is reservation i's slice.
+    """
+
+    def __init__(self):
+        self.keys: list = []
+        self.index: dict = {}
+        self.offsets = array("l", [0])
+        self.rows: list[Candidate] = []
+
+    def add(self, key, candidates: list[tuple[datetime, Location]], duration: int = 60):
+        self.index[key] = len(self.keys)
+        self.keys.append(key)
+        for date, court in candidates:
+            self.rows.append(Candidate(date, court, duration))
+        self.offsets.append(len(self.rows))
+
+    def candidates(self, key) -> list[Candidate]:
+        i = self.index.get(key)
+        if i is None:
+            return []
+        return self.rows[self.offsets[i]:self.offsets[i + 1]]
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def localize(reservation, org: OrgProfile = DEFAULT_ORG):
+    # SQLite hands dates back without their time zone; everything past loading compares them with aware ones
+    if reservation.date.tzinfo is None:
+        reservation.date = timezone(org.time_zone).localize(reservation.date)
+    return reservation
+
+
+def due(reservations: list, now: datetime, org: OrgProfile = DEFAULT_ORG) -> tuple[list, list]:
+    # (reservations to fire at today, reservations whose day has passed), dated in the club's time zone
+    reservations = [localize(r, org) for r in reservations]
+    target = (now + timedelta(days=org.horizon_days)).date()
+    fire = [r for r in reservations if r.date.date() == target]
+    expired = [r for r in reservations if r.date.date() <= now.date()]
+    return fire, expired
+
+
+def build_plan(reservations: list, org: OrgProfile = DEFAULT_ORG, keep_start: bool = False) -> CandidatePlan:
+    plan = CandidatePlan()
+    for reservation in reservations:
+        court = org.court(reservation.court_id)
+        plan.add(reservation_key(reservation), slots(reservation, court, keep_start), minutes(reservation))
+    return plan
+
+
+def slots(reservation, court: Location, keep_start: bool = False) -> list[tuple[datetime, Location]]:
+    # planB_court, but a multi-hour booking keeps its start: moving it an hour is what the split fallback is for.
+    # The split hours keep theirs too (`keep_start`), an hour later is the next piece's slot
+    candidates = planB_court(court, reservation.date)
+    if keep_start or minutes(reservation) > 60:
+        candidates = [candidate for candidate in candidates if candidate[0] == reservation.date]
+    return candidates
+
+
+def minutes(reservation) -> int:
+    # rows from before the duration column are one hour
+    return reservation.duration or 60
+
+
+def split(reservation, org: OrgProfile = DEFAULT_ORG) -> list[Reservation]:
+    # fallback for a multi-hour reservation whose single booking failed: one hourly reservation per hour it covers
+    date = localize(reservation, org).date
+    return [
+        Reservation(date + timedelta(hours=hour), reservation.court_id, acc=reservation.acc, org_id=reservation.org_id)
+        for hour in range(minutes(reservation) // 60)
+    ]
+
+
+def reservation_key(reservation) -> str:
+    key = f"{reservation.acc}|{reservation.court_id}|{reservation.date.isoformat()}"
+    # one-hour keys stay as they were, so checkpoints written before durations still resume
+    return key if minutes(reservation) == 60 else f"{key}|{minutes(reservation)}"
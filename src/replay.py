@@ -0,0 +1,205 @@
+from collections import defaultdict, deque
+from datetime import datetime
+from io import BytesIO
+from queue import Queue
+from threading import Lock
+from time import sleep
+from traceback import print_exc
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from requests import Session, Response, PreparedRequest
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from urllib3 import HTTPResponse
+
+import atexit
+import json
+import os
+import re
+
+from .threads import threads
+
+
+REDACTED = "REDACTED"
+# form fields, query params and headers that never leave the process
+SECRET_FIELDS = {"password", "username", "__requestverificationtoken", "requestdata", "email"}
+SECRET_HEADERS = {"cookie", "set-cookie", "authorization"}
+# the same secrets inside response bodies: hidden form inputs, the requestData query in the page scripts, JSON fields, emails
+SECRET_PATTERNS = [
+    re.compile(r'(name="(?:__RequestVerificationToken|RequestData)"[^>]*?value=")[^"]*', re.I),
+    re.compile(r'(value=")[^"]*(?="[^>]*?name="(?:__RequestVerificationToken|RequestData)")', re.I),
+    re.compile(r'((?:requestData|__RequestVerificationToken)=)[^&"\'\s<]*', re.I),
+    re.compile(r'("(?:__RequestVerificationToken|RequestData|Email|FirstName|LastName|MembershipNumber)"\s*:\s*")[^"]*', re.I),
+]
+EMAIL = re.compile(r"(?<![\w.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)+") # anchored at the start of a run: linear on long bodies
+
+
+def redact_pairs(pairs: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    return [(k, REDACTED if k.lower() in SECRET_FIELDS else v) for k, v in pairs]
+
+def redact_url(url: str) -> str:
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    return parts._replace(query=urlencode(redact_pairs(parse_qsl(parts.query, keep_blank_values=True)))).geturl()
+
+def redact_headers(headers) -> dict:
+    return {k: REDACTED if k.lower() in SECRET_HEADERS else v for k, v in headers.items()}
+
+def redact_text(text: str, secrets: tuple = ()) -> str:
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(lambda m: m.group(1) + REDACTED, text)
+    text = EMAIL.sub(REDACTED, text)
+    # the account's own member details (names, member ids, membership number) wherever they show up
+    for secret in secrets:
+        text = text.replace(secret, REDACTED)
+    return text
+
+def redact_body(body, secrets: tuple = ()) -> str:
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    if "=" in body and not body.lstrip().startswith(("{", "[")):
+        body = urlencode(redact_pairs(parse_qsl(body, keep_blank_values=True)))
+    return redact_text(body, secrets)
+
+
+class RecordWriter:
+    # one background thread for every Recorder: the response hook only queues a copy of the exchange
+    def __init__(self):
+        self.queue: Queue = Queue()
+        self.lock = Lock()
+        self._thread = None
+
+    def put(self, recorder: "Recorder", exchange: dict):
+        self.queue.put((recorder, exchange))
+        if self._thread is None:
+            with self.lock:
+                if self._thread is None:
+                    self._thread = threads.spawn(self._run, name="record-writer")
+
+    def _write(self, recorder: "Recorder", exchange: dict):
+        line = json.dumps(recorder.entry(exchange)) + "\n"
+        with open(recorder.path, "a") as f:
+            f.write(line)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                self._write(*item)
+            except Exception:
+                # a bad exchange (or a full disk) loses that line, never the writer
+                print_exc()
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # waits until everything queued so far is on disk
+        if self._thread is not None:
+            self.queue.join()
+
+
+writer = RecordWriter()
+atexit.register(writer.flush)
+
+
+class Recorder:
+    """
+    Appends every request/response exchange of a session to a JSONL file, one line per exchange,
+    with credentials, tokens, cookie values and member details redacted. Redacting and writing
+    happen on the shared RecordWriter thread, not in the request path.
+    """
+
+    def __init__(self, path: str, label: str = None, secrets: list[str] = ()):
+        self.path = path
+        self.label = label
+        # longest first so a value that contains another is replaced whole
+        self.secrets = tuple(sorted({str(secret) for secret in secrets if secret and len(str(secret)) > 2}, key=len, reverse=True))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def attach(self, session: Session):
+        session.hooks.setdefault("response", []).append(self.hook)
+        return session
+
+    def hook(self, res: Response, *args, **kwargs):
+        # hooks run before requests reads the body: read it here, on the caller's thread, and hand the
+        # writer a copy; the Response itself (and its stream) never leaves this thread
+        req = res.request
+        writer.put(self, {
+            "at": datetime.utcnow(),
+            "elapsed": res.elapsed.total_seconds(),
+            "method": req.method,
+            "url": req.url,
+            "request_headers": dict(req.headers),
+            "request_body": req.body,
+            "status": res.status_code,
+            "headers": dict(res.headers),
+            "cookies": sorted(res.cookies.keys()),
+            "encoding": res.encoding,
+            "content": res.content,
+        })
+        return res
+
+    def entry(self, exchange: dict) -> dict:
+        return {
+            "at": exchange["at"].isoformat(),
+            "label": self.label,
+            "elapsed": exchange["elapsed"],
+            "method": exchange["method"],
+            "url": redact_text(redact_url(exchange["url"]), self.secrets),
+            "request_headers": redact_headers(exchange["request_headers"]),
+            "request_body": redact_body(exchange["request_body"], self.secrets),
+            "status": exchange["status"],
+            "headers": redact_headers(exchange["headers"]),
+            "cookies": exchange["cookies"],
+            "encoding": exchange["encoding"],
+            "body": redact_text(exchange["content"].decode(exchange["encoding"] or "utf-8", errors="replace"), self.secrets),
+        }
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    Serves responses from a Recorder file instead of the network. Exchanges are matched by method
+    and path in recorded order, and each one takes as long as it originally did (times `speed`).
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        super().__init__()
+        self.speed = speed
+        self.lock = Lock()
+        self.exchanges: dict[tuple, deque] = defaultdict(deque)
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.exchanges[self.key(entry["method"], entry["url"])].append(entry)
+
+    @staticmethod
+    def key(method: str, url: str) -> tuple:
+        parts = urlsplit(url)
+        return (method.upper(), parts.netloc, parts.path)
+
+    def mount(self, session: Session):
+        session.mount("https://", self)
+        session.mount("http://", self)
+        return session
+
+    def send(self, request: PreparedRequest, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        with self.lock:
+            queue = self.exchanges.get(self.key(request.method, request.url))
+            entry = queue.popleft() if queue else None
+        if entry is None:
+            raise ConnectionError(f"No recorded response for {request.method} {request.url}", request=request)
+
+        if self.speed:
+            sleep(entry["elapsed"] * self.speed)
+
+        headers = {k: v for k, v in entry["headers"].items() if k.lower() not in ("content-encoding", "content-length", "transfer-encoding", "set-cookie")}
+        body = entry["body"].encode(entry.get("encoding") or "utf-8")
+        raw = HTTPResponse(body=BytesIO(body), headers=headers, status=entry["status"], preload_content=False, decode_content=False)
+        response = self.build_response(request, raw)
+        for name in entry.get("cookies", []):
+            response.cookies.set(name, REDACTED)
+        return response
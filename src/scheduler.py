@@ -0,0 +1,181 @@
+from concurrent.futures import Future
+from heapq import heappush, heappop
+from itertools import count
+from threading import Condition, Thread
+from time import time
+
+from .config import SCHEDULER_WORKERS, SCHEDULER_RESERVED
+from .metrics import registry
+
+
+# lower runs first
+FIRE, FALLBACK, HOUSEKEEPING = 0, 1, 2
+PRIORITY_NAMES = {FIRE: "fire", FALLBACK: "fallback", HOUSEKEEPING: "housekeeping"}
+
+QUEUE_DEPTH = registry.gauge("courtreserve_scheduler_queue_depth", "Tasks ready to run, by priority", ("priority",))
+TIMED_DEPTH = registry.gauge("courtreserve_scheduler_timed_depth", "Tasks waiting for their start time")
+ACTIVE = registry.gauge("courtreserve_scheduler_active_workers", "Tasks currently running")
+LATENESS = registry.histogram("courtreserve_scheduler_lateness_seconds", "Delay between a task's start time and when it ran", ("priority",))
+
+
+class Task:
+    def __init__(self, fn, args, kwargs, priority: int, account: str, at: float):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.account = account
+        self.at = at
+        self.future = Future()
+
+
+class Scheduler:
+    """
+    Single process-wide pool for the burst and everything around it.
+
+    Tasks run by priority (FIRE > FALLBACK > HOUSEKEEPING); within a priority accounts take turns,
+    and a task can be held back until a wall-clock time (`at`, epoch seconds) instead of sleeping in a thread.
+
+    `reserved` workers only run timed FIRE/FALLBACK tasks (the POSTs waiting for their fire time): nothing
+    running can be interrupted, so without them a burst's form fetches could hold every worker at the trigger.
+    """
+
+    def __init__(self, max_workers: int = 16, name: str = "scheduler", reserved: int = 0):
+        self.max_workers = max_workers
+        self.reserved = min(reserved, max_workers - 1)
+        self.name = name
+
+        self._ready = [] # (priority, account turn, seq, task)
+        self._urgent = [] # same, for timed FIRE/FALLBACK tasks
+        self._regular = 0 # running tasks that aren't urgent
+        self._timed = [] # (at, seq, task)
+        self._turns: dict[tuple, int] = {}
+        self._seq = count()
+        self._cond = Condition()
+        self._threads: list[Thread] = []
+        self._idle = 0
+        self._shutdown = False
+
+    def submit(self, fn, *args, priority: int = HOUSEKEEPING, account: str = None, at: float = None, **kwargs) -> Future:
+        task = Task(fn, args, kwargs, priority, account, at)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("scheduler is shut down")
+
+            if at is not None and at > time():
+                heappush(self._timed, (at, next(self._seq), task))
+                TIMED_DEPTH.set(len(self._timed))
+            else:
+                self._push_ready(task)
+
+            self._spawn()
+            self._cond.notify()
+        return task.future
+
+    def _spawn(self):
+        # called with self._cond held
+        if self._idle == 0 and len(self._threads) < self.max_workers:
+            thread = Thread(target=self._run, daemon=True, name=f"{self.name}-{len(self._threads)}")
+            self._threads.append(thread)
+            thread.start()
+
+    def _push_ready(self, task: Task):
+        # the n-th task an account queues at a priority gets turn n, so accounts interleave
+        turn_key = (task.priority, task.account)
+        turn = self._turns.get(turn_key, 0)
+        self._turns[turn_key] = turn + 1
+        heappush(self._urgent if self._is_urgent(task) else self._ready, (task.priority, turn, next(self._seq), task))
+        QUEUE_DEPTH.inc(priority=PRIORITY_NAMES.get(task.priority, task.priority))
+
+    @staticmethod
+    def _is_urgent(task: Task) -> bool:
+        return task.at is not None and task.priority <= FALLBACK
+
+    def _pick(self) -> list:
+        # the heap to pop from: best task first, but regular tasks never take the reserved workers
+        regular_free = self._regular < self.max_workers - self.reserved
+        if self._ready and regular_free and (not self._urgent or self._ready[0] < self._urgent[0]):
+            return self._ready
+        return self._urgent or None
+
+    def _next(self) -> Task:
+        with self._cond:
+            while True:
+                now = time()
+                while self._timed and self._timed[0][0] <= now:
+                    self._push_ready(heappop(self._timed)[2])
+                TIMED_DEPTH.set(len(self._timed))
+
+                ready = self._pick()
+                if ready:
+                    task = heappop(ready)[3]
+                    QUEUE_DEPTH.dec(priority=PRIORITY_NAMES.get(task.priority, task.priority))
+                    if not self._ready and not self._urgent:
+                        self._turns.clear()
+                    if not self._is_urgent(task):
+                        self._regular += 1
+                    if self._urgent:
+                        # timed tasks that came due together each get a worker
+                        self._spawn()
+                    return task
+
+                if self._shutdown and not self._timed:
+                    return None
+
+                self._idle += 1
+                self._cond.wait(self._timed[0][0] - now if self._timed else None)
+                self._idle -= 1
+
+    def _run(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            if not task.future.set_running_or_notify_cancel():
+                self._done(task)
+                continue
+
+            if task.at is not None:
+                LATENESS.observe(max(0, time() - task.at), priority=PRIORITY_NAMES.get(task.priority, task.priority))
+
+            ACTIVE.inc()
+            try:
+                task.future.set_result(task.fn(*task.args, **task.kwargs))
+            except BaseException as e:
+                task.future.set_exception(e)
+            finally:
+                ACTIVE.dec()
+                self._done(task)
+
+    def _done(self, task: Task):
+        if not self._is_urgent(task):
+            with self._cond:
+                self._regular -= 1
+                # a regular task may have been waiting for this slot
+                self._cond.notify()
+
+    def depth(self) -> dict:
+        with self._cond:
+            return {"ready": len(self._ready) + len(self._urgent), "timed": len(self._timed), "threads": len(self._threads)}
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+scheduler = Scheduler(SCHEDULER_WORKERS, reserved=SCHEDULER_RESERVED)
+
+
+def wait_all(futures: list[Future]):
+    # waits for `futures` and for anything appended to the list while waiting
+    i = 0
+    while i < len(futures):
+        try:
+            futures[i].result()
+        except Exception:
+            pass
+        i += 1
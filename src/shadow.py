@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from time import perf_counter
+from traceback import format_exc
+
+from pytz import timezone
+from telebot import TeleBot
+
+from .accounts import accounts
+from .config import SHADOW_TIME
+from .courtreserve import ReserveBot
+from .database import Reservation, Attempt
+from .logger import Logger
+from .orgs import OrgProfile
+from .scheduler import scheduler, wait_all, HOUSEKEEPING
+from .metrics import registry
+
+
+SHADOW_RUNS = registry.counter("courtreserve_shadow_runs_total", "Shadow dry-fires by outcome", ("outcome",))
+PHASES = ("login", "url", "token", "warm")
+
+
+class Shadow:
+    """
+    Daily dry-fire of the real pipeline against the live site: login check, create_reservation_url,
+    token extraction and the connection warm-up, for every account. It stops right before the
+    CreateReservation POST and records the phases in the attempt history (mode "shadow"), so slow
+    phases and markup changes show up before the release morning instead of during it.
+    """
+
+    def __init__(self, org: OrgProfile, logger: Logger, bot: TeleBot, at: str = SHADOW_TIME):
+        self.org = org
+        self.logger = logger
+        self.bot = bot
+        self.at = datetime.strptime(at, "%H:%M").time() if at else None
+        self.zone = timezone(org.time_zone)
+
+    def next_run(self, now: datetime) -> datetime:
+        run = now.replace(hour=self.at.hour, minute=self.at.minute, second=0, microsecond=0)
+        return run if run > now else run + timedelta(days=1)
+
+    def start(self):
+        if self.at is None:
+            return
+        run = self.next_run(datetime.now(tz=self.zone))
+        # housekeeping priority: a burst running at the same time always goes first
+        scheduler.submit(self.run, priority=HOUSEKEEPING, at=run.timestamp())
+
+    def target(self, acc: str, now: datetime):
+        # the page the next burst will load: this account's first pending reservation, else the first court at opening
+        day = (now + timedelta(days=self.org.horizon_days)).date()
+        pending = sorted((r for r in Reservation.all() if r.acc == acc and (r.org_id or self.org.org_id) == self.org.org_id and r.date.date() >= now.date()), key=lambda r: r.date)
+        if pending:
+            court, hour = self.org.court(pending[0].court_id), pending[0].date.hour
+        else:
+            court, hour = next(iter(self.org.catalog.values())), self.org.open
+        return self.zone.localize(datetime(day.year, day.month, day.day, hour)), court
+
+    def dry_fire(self, acc: str) -> dict:
+        date, court = self.target(acc, datetime.now(tz=self.zone))
+        trace = {}
+        try:
+            started = perf_counter()
+            resbot = ReserveBot(Reservation(date, court.id, acc=acc, org_id=self.org.org_id), self.logger, self.bot)
+            trace["login_ms"] = (perf_counter() - started) * 1000
+        except Exception as e:
+            Attempt.record(acc=acc, court_id=court.id, slot=date, mode="shadow", message=f"login: {type(e).__name__}: {e}")
+            return {"isValid": False, "message": f"login: {type(e).__name__}: {e}"}
+
+        resbot.mode = "shadow"
+        try:
+            prepared = resbot.prepare(date, court, trace)
+            # everything up to the POST worked; the request is dropped here
+            resrv = {"isValid": "request" in prepared, "message": prepared.get("message", "")}
+        except Exception as e:
+            self.logger.error(format_exc(), False)
+            resrv = {"isValid": False, "message": f"{type(e).__name__}: {e}"}
+        finally:
+            resbot.close()
+        resbot.record(date, court, None, trace, resrv)
+        return dict(resrv, **trace)
+
+    def run(self):
+        try:
+            baseline = Attempt.stats(14)["shadow"]["phases"]
+            runs = {acc: scheduler.submit(self.dry_fire, acc, priority=HOUSEKEEPING, account=acc) for acc in accounts.names(self.org.org_id)}
+            wait_all(list(runs.values()))
+
+            problems = []
+            for acc, future in runs.items():
+                result = future.result() if future.exception() is None else {"isValid": False, "message": str(future.exception())}
+                SHADOW_RUNS.inc(outcome="ok" if result["isValid"] else "failed")
+                if not result["isValid"]:
+                    problems.append(f"[{acc}] dry-fire failed: {result['message']}")
+                for phase in PHASES:
+                    took, (_, p90) = result.get(f"{phase}_ms"), baseline.get(phase, (None, None))
+                    if took is not None and p90 and took > 2 * p90:
+                        problems.append(f"[{acc}] {phase} took {took:.0f}ms, 14 day p90 is {p90:.0f}ms")
+
+            if problems:
+                self.logger.warning(f"[{self.org.name}] Shadow run:\n" + "\n".join(problems))
+            else:
+                self.logger.info(f"[{self.org.name}] Shadow run OK for {len(runs)} account(s)", True)
+        except Exception:
+            self.logger.error(format_exc())
+        finally:
+            self.start()
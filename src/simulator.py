@@ -0,0 +1,131 @@
+"""
+Offline simulator for the release-morning burst.
+
+Each simulated morning draws a server release time, a latency for every request we send and, per
+candidate slot, the moment a competing booker takes it. A strategy (delay schedule + candidate
+order) is then scored by how often it books something and how many requests it spends doing so.
+All mornings are sampled at once as numpy arrays, so thousands of them take well under a second.
+
+    python -m src.simulator --mornings 20000
+"""
+
+from argparse import ArgumentParser
+
+import numpy as np
+
+
+CANDIDATES = 4 # planB_court: requested court/hour, sibling court, both an hour later
+
+
+class Model:
+    def __init__(self, latencies: np.ndarray = None, release_mean: float = .05, release_sd: float = .15,
+                 competitors: tuple = (3, 2, 1.5, 1), competitor_scale: float = 1.5, early_reject: bool = True):
+        # latencies: recorded POST round trips in seconds; a lognormal fit is used when there are none
+        self.latencies = latencies if latencies is not None and len(latencies) else None
+        self.release_mean = release_mean # server release relative to our START_HOUR clock (skew + jitter)
+        self.release_sd = release_sd
+        self.competitors = np.asarray(competitors, dtype=float) # mean competing bookers per candidate slot
+        self.competitor_scale = competitor_scale # mean seconds after release until a competitor lands
+        self.early_reject = early_reject # requests arriving before the release are simply refused
+
+    def sample_latency(self, rng: np.random.Generator, shape: tuple) -> np.ndarray:
+        if self.latencies is not None:
+            return rng.choice(self.latencies, size=shape)
+        return rng.lognormal(mean=np.log(.35), sigma=.45, size=shape)
+
+    def sample(self, rng: np.random.Generator, mornings: int):
+        release = rng.normal(self.release_mean, self.release_sd, size=mornings)
+
+        # per slot: the first competitor to land after the release takes it (inf if nobody shows up)
+        counts = rng.poisson(self.competitors, size=(mornings, len(self.competitors)))
+        first = rng.exponential(self.competitor_scale, size=(mornings, len(self.competitors))) / np.maximum(counts, 1)
+        taken = np.where(counts > 0, release[:, None] + first, np.inf)
+        return release, taken
+
+
+class Strategy:
+    def __init__(self, name: str, delays, order):
+        # delays: fire time of each request after the trigger; order: candidate index of each request
+        self.name = name
+        self.delays = np.asarray(delays, dtype=float)
+        self.order = np.asarray(order, dtype=int)
+
+    @staticmethod
+    def from_curve(name: str, curve, rounds: int = 7, candidates: list = None):
+        # same shape as ReserveBot.reserve_worker: cumulative curve(x) over `rounds` passes of the candidates
+        candidates = candidates if candidates is not None else list(range(CANDIDATES))
+        delays, order, delay = [], [], 0
+        for x in range(rounds * len(candidates)):
+            delays.append(delay)
+            order.append(candidates[x % len(candidates)])
+            delay += curve(x)
+        return Strategy(name, delays, order)
+
+
+def simulate(model: Model, strategy: Strategy, mornings: int = 10000, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    release, taken = model.sample(rng, mornings)
+
+    latency = model.sample_latency(rng, (mornings, len(strategy.delays)))
+    # the server handles a request roughly halfway through its round trip
+    arrival = strategy.delays[None, :] + latency / 2
+    answered = strategy.delays[None, :] + latency
+
+    open_ = arrival >= release[:, None] if model.early_reject else np.ones_like(arrival, dtype=bool)
+    free = arrival < taken[np.arange(mornings)[:, None], strategy.order[None, :]]
+    wins = open_ & free
+
+    won = wins.any(axis=1)
+    # the win is known once its response is back; every request sent before that was spent
+    known = np.where(wins, answered, np.inf).min(axis=1)
+    cost = (strategy.delays[None, :] <= known[:, None]).sum(axis=1)
+    first_win = np.where(won, np.argmax(wins, axis=1), -1)
+
+    return {
+        "strategy": strategy.name,
+        "win_probability": float(won.mean()),
+        "mean_requests": float(cost.mean()),
+        "requests_per_win": float(cost.sum() / max(won.sum(), 1)),
+        "median_win_index": float(np.median(first_win[won])) if won.any() else None,
+    }
+
+
+def recorded_latencies(days: int = 60) -> np.ndarray:
+    # POST round trips of past release bursts, in seconds
+    from datetime import datetime, timedelta
+    from .database import Attempt, db
+
+    since = datetime.utcnow() - timedelta(days=days)
+    with db.session() as session:
+        rows = session.query(Attempt.post_ms).filter(Attempt.created_at >= since, Attempt.post_ms != None, Attempt.burst()).all()
+    return np.asarray([row[0] for row in rows], dtype=float) / 1000
+
+
+def default_strategies() -> list[Strategy]:
+    return [
+        Strategy.from_curve("current (2x²+4x+10)/35", lambda x: (2*x**2 + 4*x + 10) / 35),
+        Strategy.from_curve("linear 250ms", lambda x: .25),
+        Strategy.from_curve("linear 100ms", lambda x: .1),
+        Strategy.from_curve("front-loaded", lambda x: .05 if x < 8 else .5),
+        Strategy.from_curve("current, hour-first", lambda x: (2*x**2 + 4*x + 10) / 35, candidates=[0, 2, 1, 3]),
+        Strategy.from_curve("linear 100ms, 3 rounds", lambda x: .1, rounds=3),
+    ]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Score delay schedules and candidate orders against simulated release mornings")
+    parser.add_argument("--mornings", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--recorded", action="store_true", help="sample latencies from the attempt history")
+    parser.add_argument("--release-mean", type=float, default=.05)
+    parser.add_argument("--release-sd", type=float, default=.15)
+    args = parser.parse_args()
+
+    latencies = recorded_latencies() if args.recorded else None
+    model = Model(latencies, release_mean=args.release_mean, release_sd=args.release_sd)
+
+    print(f"{'strategy':<28} {'win %':>7} {'requests':>9} {'req/win':>8} {'win idx':>8}")
+    for strategy in default_strategies():
+        result = simulate(model, strategy, args.mornings, args.seed)
+        print(f"{result['strategy']:<28} {result['win_probability'] * 100:>6.1f}% {result['mean_requests']:>9.1f} "
+              f"{result['requests_per_win']:>8.1f} {result['median_win_index'] if result['median_win_index'] is not None else '-':>8}")
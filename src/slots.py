@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+from threading import Lock
+
+from .config import Location
+
+
+Slot = tuple[int, datetime] # (court id, start of one hour)
+
+
+def slot_key(court: Location, date: datetime) -> Slot:
+    return (court.id, date)
+
+def slot_keys(court: Location, date: datetime, minutes: int = 60) -> tuple[Slot, ...]:
+    # every hour a booking covers: a 2h booking at 7 conflicts with someone else's 8 o'clock on that court
+    return tuple(slot_key(court, date + timedelta(hours=hour)) for hour in range(max(1, minutes // 60)))
+
+
+class SlotClaims:
+    """
+    Shared claim table so our own accounts don't race each other for the same court/hour.
+
+    Reads are plain dict lookups (atomic under the GIL) so the fire path never waits on
+    the lock; only claims/releases are serialized.
+    """
+
+    def __init__(self):
+        self._owners: dict[Slot, str] = {}
+        self._booked: dict[Slot, str] = {}
+        self._lock = Lock()
+
+    def reset(self):
+        with self._lock:
+            self._owners = {}
+            self._booked = {}
+
+    def owner(self, slot: Slot):
+        return self._owners.get(slot)
+
+    def claim(self, slots: tuple[Slot, ...], owner: str) -> bool:
+        # True if `owner` holds every hour after the call; all of them or none
+        with self._lock:
+            if any(slot in self._booked or self._owners.get(slot, owner) != owner for slot in slots):
+                return False
+            for slot in slots:
+                self._owners[slot] = owner
+            return True
+
+    def assign(self, plans: list[tuple[str, list[tuple[datetime, Location]]]]):
+        # round-robin over the accounts: each takes its next unclaimed candidate in turn,
+        # so together they cover as many distinct slots as possible
+        depth = max((len(candidates) for _, candidates in plans), default=0)
+        for i in range(depth):
+            for owner, candidates in plans:
+                if i < len(candidates):
+                    self.claim(self.span(candidates[i]), owner)
+
+    @staticmethod
+    def span(candidate) -> tuple[Slot, ...]:
+        # planner.Candidate carries its duration, plain (date, court) tuples are one hour
+        date, court = candidate
+        return slot_keys(court, date, getattr(candidate, "duration", 60))
+
+    def order(self, owner: str, candidates: list[tuple[datetime, Location]]) -> list[tuple[datetime, Location]]:
+        # own claims first, free slots next, slots held by another account last
+        def rank(candidate):
+            holders = {self.owner(slot) for slot in self.span(candidate)}
+            if holders == {owner}:
+                return 0
+            return 1 if holders <= {owner, None} else 2
+
+        return sorted(candidates, key=rank)
+
+    def is_blocked(self, slots: tuple[Slot, ...], owner: str) -> bool:
+        # lock-free check used right before firing
+        for slot in slots:
+            if slot in self._booked:
+                return True
+            holder = self._owners.get(slot)
+            if holder is not None and holder != owner:
+                return True
+        return False
+
+    def release(self, owner: str):
+        # `owner` is done firing (missed everything): its claims are free for the others
+        with self._lock:
+            self._owners = {k: v for k, v in self._owners.items() if v != owner}
+
+    def book(self, slots: tuple[Slot, ...], owner: str):
+        # `owner` won these hours: nobody fires at them anymore and all its other claims are freed
+        with self._lock:
+            for slot in slots:
+                self._booked[slot] = owner
+            self._owners = {k: v for k, v in self._owners.items() if v != owner}
+
+
+claims = SlotClaims()
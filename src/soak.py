@@ -0,0 +1,240 @@
+"""
+Soak check for resource leaks.
+
+Runs the worker against local stand-ins of the CourtReserve site and Telegram: one release burst,
+one shadow dry-fire and a round of menu traffic per simulated day. Threads, open files, sockets and
+RSS are sampled every day, and the check fails if they keep growing after the first days. The first
+day also runs one cancellation poll on a reservation read back from the database. Runs in a
+temporary directory, so the real database, logs and checkpoints are left alone.
+
+    python -m src.soak --days 30
+"""
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socket import IPPROTO_TCP, TCP_NODELAY
+from threading import Lock
+from time import sleep
+from urllib.parse import urlsplit
+
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+
+
+class LocalSite(BaseHTTPRequestHandler):
+    # just enough of app.courtreserve.com / reservations.courtreserve.com for ReserveBot
+    protocol_version = "HTTP/1.1"
+    lock = Lock()
+    misses = 0 # CreateReservation POSTs left to refuse today
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+
+    def _reply(self, code: int, body: str = "", headers: dict = None):
+        data = body.encode()
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_HEAD(self):
+        self._reply(200)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if "/Reservations/Index/" in path:
+            self._reply(200, "<script>OrganizationMemberFavoriteApi?requestData=soak&x=1</script>")
+        elif "CreateReservationCourtsView" in path:
+            self._reply(200, "<script>fixUrl('https://app.courtreserve.com/Online/Reservations/Form?id=1&amp;x=2')</script>")
+        elif path.endswith("/Reservations/Form"):
+            self._reply(200, '<form><input name="__RequestVerificationToken" value="token"><input name="RequestData" value="data"></form>')
+        else:
+            self._reply(404)
+
+    def do_POST(self):
+        self._body()
+        path = urlsplit(self.path).path
+        if path.endswith("/Account/Login"):
+            self._reply(302, headers={
+                "Location": "https://app.courtreserve.com/Online/Reservations/Index/1",
+                "Set-Cookie": ".AspNet.ApplicationCookie=soak; path=/",
+            })
+        elif "CreateReservation" in path:
+            with LocalSite.lock:
+                won = LocalSite.misses <= 0
+                LocalSite.misses -= 1
+            self._reply(200, json.dumps({"isValid": won, "message": "" if won else "Court is not available"}), {"Content-Type": "application/json"})
+        else:
+            self._reply(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeTeleBot:
+    sent = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def send_message(self, *args, **kwargs):
+        FakeTeleBot.sent += 1
+
+    def send_document(self, *args, **kwargs):
+        FakeTeleBot.sent += 1
+
+
+def local_adapter(base: str):
+    from requests.adapters import HTTPAdapter
+
+    class LocalAdapter(HTTPAdapter):
+        # sends every https:// request to the local stand-in, keeping path and query
+        def send(self, request, **kwargs):
+            parts = urlsplit(request.url)
+            request.url = base + parts.path + (f"?{parts.query}" if parts.query else "")
+            return super().send(request, **kwargs)
+
+    return LocalAdapter
+
+
+def settle(scheduler):
+    # wait for the housekeeping left by the burst (notifications, deletes, attempt batches)
+    for _ in range(100):
+        if not scheduler.depth()["ready"]:
+            break
+        sleep(.05)
+    sleep(2.5)
+
+
+def check_watch(worker, now) -> list[str]:
+    # one cancellation poll on a reservation as the worker loads it: from the database, where SQLite drops the time zone
+    from datetime import timedelta
+    from src.config import Location
+    from src.database import Reservation
+    from src.planner import due, reservation_key
+    from src.watch import Watch
+
+    target = now.replace(minute=0, second=0, microsecond=0) + timedelta(days=worker.org.horizon_days, hours=1)
+    Reservation.add(Reservation(target, Location.PICKLEBALL_2B.id, acc="zafar"))
+    saved = [r for r in Reservation.all() if str(r.court_id) == str(Location.PICKLEBALL_2B.id) and r.date.hour == target.hour]
+    reservation = next(iter(due(saved, now, worker.org)[0]), None)
+    if reservation is None:
+        return ["watch: the reservation read back from the database is not due"]
+
+    resbot = worker.build([reservation]).get(reservation_key(reservation))
+    if resbot is None:
+        Reservation.delete(reservation)
+        return ["watch: could not build the bot"]
+    resbot.mode = "watch"
+    watch = Watch(resbot, resbot.candidates())
+    worker.watcher.watches[resbot.owner] = watch
+    LocalSite.misses = 1 # the poll's POST is refused, so the watch carries on
+    try:
+        worker.watcher.poll(watch)
+        if watch.polls != 1 or resbot.owner not in worker.watcher.watches:
+            return [f"watch: expected one refused poll, got {watch.polls} poll(s)"]
+        return []
+    except Exception as e:
+        return [f"watch: poll failed: {type(e).__name__}: {e}"]
+    finally:
+        if resbot.owner in worker.watcher.watches:
+            worker.watcher.stop(watch, "soak check done")
+        Reservation.delete(reservation)
+
+
+def main(days: int, warmup: int, seed: int) -> int:
+    random.seed(seed)
+    os.chdir(tempfile.mkdtemp(prefix="courtreserve-soak-"))
+    os.environ["CREDS"] = json.dumps({"zafar": {"ASP.NET_SessionId": "soak"}, "mike": {"ASP.NET_SessionId": "soak"}})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalSite)
+    server.daemon_threads = True
+
+    import src.logger
+    src.logger.TeleBot = FakeTeleBot
+    import src.courtreserve as courtreserve
+    courtreserve.HTTPAdapter = local_adapter(f"http://127.0.0.1:{server.server_port}")
+
+    from datetime import datetime, timedelta
+    from src.config import Location
+    from src.database import Reservation, Attempt
+    from src.logger import Logger
+    from src.metrics import resources
+    from src.orgs import DEFAULT_ORG
+    from src.scheduler import scheduler
+    from src.threads import threads
+    from src.worker import Worker
+
+    threads.spawn(server.serve_forever, name="soak-site")
+    logger = Logger("soak")
+    worker = Worker(FakeTeleBot(), logger, DEFAULT_ORG)
+    worker.shadow.at = None # run by hand below, once per simulated day
+    courts = list(DEFAULT_ORG.catalog.values())
+
+    samples, checks = [], []
+    for day in range(days):
+        now = datetime.now(tz=worker.zone)
+        target = now.replace(minute=0, second=0, microsecond=0) + timedelta(days=DEFAULT_ORG.horizon_days)
+        for acc, court in (("zafar", Location.PICKLEBALL_1A), ("mike", Location.HARD_TENNIS_1)):
+            Reservation.add(Reservation(target, court.id, acc=acc))
+
+        # burst: releases "now", the first few POSTs of the day are refused, then the slots free up
+        DEFAULT_ORG.release_hour = now.hour
+        LocalSite.misses = random.randint(0, 3)
+        worker.worker()
+        worker.shadow.run()
+        if day == 0:
+            checks = check_watch(worker, now)
+
+        # menu traffic: what /reserve, the menus and /stats read and write
+        for _ in range(20):
+            later = now.replace(minute=0, second=0, microsecond=0) + timedelta(days=random.randint(3, 6), hours=random.randint(0, 3))
+            reservation = Reservation(later, random.choice(courts).id, acc=random.choice(("zafar", "mike")))
+            Reservation.add(reservation)
+            for saved in Reservation.all():
+                Reservation.get(saved.id)
+            Reservation.delete(reservation)
+        Attempt.stats(30)
+
+        settle(scheduler)
+        gc.collect()
+        usage = resources()
+        samples.append(usage)
+        print(f"day {day + 1:>3}: threads {usage['threads']:>3}  fds {usage['fds']}  sockets {usage['sockets']}  "
+              f"rss {usage['rss'] / 2**20 if usage['rss'] else 0:.1f}MB  telegram {FakeTeleBot.sent}  background {len(threads.alive())}", flush=True)
+
+    server.shutdown()
+    base, last = samples[min(warmup, len(samples) - 1)], samples[-1]
+    limits = {"threads": 2, "fds": 6, "sockets": 4, "rss": 24 * 2**20}
+    failures = [
+        f"{key} grew from {base[key]} to {last[key]}"
+        for key, limit in limits.items()
+        if base[key] is not None and last[key] - base[key] > limit
+    ]
+    for failure in failures:
+        print(f"LEAK: {failure}")
+    for check in checks:
+        print(f"FAILED: {check}")
+    print("resource use stayed flat" if not failures else f"{len(failures)} resource(s) kept growing")
+    return 1 if failures or checks else 0
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Simulate days of bursts and menu traffic against local stand-ins and check for leaks")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3, help="days before the baseline sample")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(main(args.days, args.warmup, args.seed))
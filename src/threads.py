@@ -0,0 +1,43 @@
+from threading import Thread, Lock
+
+from .metrics import registry
+
+
+BACKGROUND_THREADS = registry.gauge("courtreserve_background_threads", "Long-lived threads started through the registry")
+REFUSED = registry.counter("courtreserve_background_threads_refused_total", "Threads not started because the registry was full")
+
+
+class ThreadRegistry:
+    """
+    Every long-lived thread the process starts goes through here, so their number is bounded and known.
+    Finished threads are pruned on each spawn; spawning past `limit` raises instead of piling up.
+    """
+
+    def __init__(self, limit: int = 32):
+        self.limit = limit
+        self.threads: list[Thread] = []
+        self.lock = Lock()
+
+    def _prune(self):
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+        BACKGROUND_THREADS.set(len(self.threads))
+
+    def spawn(self, target, *args, name: str = None, daemon: bool = True, **kwargs) -> Thread:
+        with self.lock:
+            self._prune()
+            if len(self.threads) >= self.limit:
+                REFUSED.inc()
+                raise RuntimeError(f"background thread limit reached ({self.limit}), not starting {name or target}")
+            thread = Thread(target=target, args=args, kwargs=kwargs, name=name, daemon=daemon)
+            thread.start()
+            self.threads.append(thread)
+            BACKGROUND_THREADS.set(len(self.threads))
+            return thread
+
+    def alive(self) -> list[str]:
+        with self.lock:
+            self._prune()
+            return [thread.name for thread in self.threads]
+
+
+threads = ThreadRegistry()
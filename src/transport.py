@@ -0,0 +1,185 @@
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep, time
+from urllib.parse import urlsplit
+
+from requests import Session, Response, PreparedRequest
+from requests.exceptions import RequestException
+
+from .logger import Logger
+from .metrics import registry
+
+
+REQUESTS = registry.counter("courtreserve_http_requests_total", "HTTP requests by host, phase and outcome", ("host", "phase", "outcome"))
+RETRIES = registry.counter("courtreserve_http_retries_total", "Retried HTTP requests", ("host", "phase"))
+LATENCY = registry.histogram("courtreserve_http_latency_seconds", "HTTP request latency", ("host", "phase"))
+BREAKER_STATE = registry.gauge("courtreserve_circuit_open", "1 while the host's circuit breaker is open", ("host",))
+BREAKER_REJECTIONS = registry.counter("courtreserve_circuit_rejections_total", "Requests refused by an open circuit", ("host", "phase"))
+
+
+class RequestPolicy:
+    def __init__(self, phase: str, timeout=(3.05, 10), retries: int = 0, backoff: float = .25, max_backoff: float = 4,
+                 deadline: float = None, retry_statuses: tuple = (429, 500, 502, 503, 504), use_breaker: bool = True):
+        self.phase = phase
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline # seconds for the whole call, retries included
+        self.retry_statuses = retry_statuses
+        self.use_breaker = use_breaker
+
+    def delay(self, attempt: int, res: Response = None) -> float:
+        retry_after = res.headers.get("Retry-After") if res is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        # full jitter
+        return uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+# warm-up and form fetching before the trigger; can afford to retry
+PREPARE_POLICY = RequestPolicy("prepare", timeout=(3.05, 10), retries=3, deadline=30)
+LOGIN_POLICY = RequestPolicy("login", timeout=(3.05, 15), retries=2, deadline=45)
+# the CreateReservation POST: one shot, short deadline, never held back by the breaker
+FIRE_POLICY = RequestPolicy("fire", timeout=(2, 8), retries=0, deadline=8, use_breaker=False)
+
+
+class CircuitBreaker:
+    def __init__(self, host: str, threshold: int = 5, cooldown: float = 30):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None # the half-open probe in flight; it expires after another cooldown if it never reports back
+        self.lock = Lock()
+
+    def allow(self) -> bool:
+        if self.opened_at is None or suspended():
+            return True
+        with self.lock:
+            now = monotonic()
+            if self.opened_at is None:
+                return True
+            if now - self.opened_at < self.cooldown:
+                return False
+            # half-open: a single probe goes through, everyone else waits for its outcome
+            if self.probe_at is not None and now - self.probe_at < self.cooldown:
+                return False
+            self.probe_at = now
+            return True
+
+    def release(self):
+        # the probe got an answer that says nothing about the host's health
+        with self.lock:
+            self.probe_at = None
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.probe_at = None
+            if self.opened_at is not None:
+                self.opened_at = None
+                BREAKER_STATE.set(0, host=self.host)
+
+    def failure(self):
+        if suspended():
+            return
+        with self.lock:
+            self.probe_at = None
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = monotonic()
+                BREAKER_STATE.set(1, host=self.host)
+
+
+breakers: dict[str, CircuitBreaker] = {}
+breakers_lock = Lock()
+# epoch seconds until which no breaker counts failures or refuses requests: a few 503s during
+# the lead must not cost every account its form, and with it the whole release burst
+suspended_until = 0.0
+
+def suspend_breakers(until: float):
+    global suspended_until
+    with breakers_lock:
+        suspended_until = max(suspended_until, until)
+
+def suspended() -> bool:
+    return time() < suspended_until
+
+def get_breaker(host: str) -> CircuitBreaker:
+    breaker = breakers.get(host)
+    if breaker is None:
+        with breakers_lock:
+            breaker = breakers.setdefault(host, CircuitBreaker(host))
+    return breaker
+
+
+class Transport:
+    def __init__(self, session: Session, logger: Logger):
+        self.session = session
+        self.logger = logger
+
+    def request(self, method: str, url: str, policy: RequestPolicy = PREPARE_POLICY, trace: dict = None, **kwargs) -> Response:
+        """
+        Sends the request under `policy` and returns the response, or None once the retries,
+        the deadline or the host's circuit breaker say to give up.
+        """
+        return self._execute(method, url, policy, trace, lambda timeout: self.session.request(method, url, timeout=timeout, **kwargs))
+
+    def send(self, prepared: PreparedRequest, policy: RequestPolicy = FIRE_POLICY, trace: dict = None) -> Response:
+        # same as request() for a body that was already prepared (see forms.ReservationTemplate)
+        return self._execute(prepared.method, prepared.url, policy, trace, lambda timeout: self.session.send(prepared, timeout=timeout))
+
+    def _execute(self, method: str, url: str, policy: RequestPolicy, trace: dict, call) -> Response:
+        host = urlsplit(url).netloc
+        breaker = get_breaker(host)
+        started = monotonic()
+        attempt = 0
+
+        while True:
+            if policy.use_breaker and not breaker.allow():
+                BREAKER_REJECTIONS.inc(host=host, phase=policy.phase)
+                self.logger.warning(f"{method} {url} skipped, circuit open for {host}", False)
+                return None
+
+            timeout = policy.timeout
+            if policy.deadline is not None:
+                remaining = policy.deadline - (monotonic() - started)
+                if remaining <= 0:
+                    REQUESTS.inc(host=host, phase=policy.phase, outcome="deadline")
+                    self.logger.warning(f"{method} {url} gave up after {policy.deadline}s", False)
+                    return None
+                timeout = tuple(min(t, remaining) for t in timeout) if isinstance(timeout, tuple) else min(timeout, remaining)
+
+            res, error = None, None
+            sent = monotonic()
+            try:
+                res = call(timeout)
+            except RequestException as e:
+                error = e
+            LATENCY.observe(monotonic() - sent, host=host, phase=policy.phase)
+
+            if trace is not None and res is not None:
+                trace["status"] = res.status_code
+
+            if res is not None and res.ok:
+                breaker.success()
+                REQUESTS.inc(host=host, phase=policy.phase, outcome="ok")
+                return res
+
+            retryable = error is not None or res.status_code in policy.retry_statuses
+            if retryable:
+                breaker.failure()
+            else:
+                breaker.release()
+
+            if not retryable or attempt >= policy.retries:
+                outcome = type(error).__name__ if error is not None else str(res.status_code)
+                REQUESTS.inc(host=host, phase=policy.phase, outcome=outcome)
+                self.logger.warning(f"{method} {url} failed ({outcome}) after {attempt + 1} attempt(s)", False)
+                return None
+
+            RETRIES.inc(host=host, phase=policy.phase)
+            sleep(policy.delay(attempt, res))
+            attempt += 1
@@ -0,0 +1,174 @@
+from collections import deque
+from datetime import datetime
+from threading import Lock
+from time import time
+from traceback import format_exc
+
+from .config import WATCH_BUDGET, WATCH_INTERVAL, WATCH_TOKEN_AGE
+from .logger import Logger
+from .planner import Candidate
+from .scheduler import scheduler, FALLBACK
+from .metrics import registry
+
+
+WATCHED = registry.gauge("courtreserve_watched_reservations", "Unfulfilled reservations being watched for cancellations")
+WATCH_REQUESTS = registry.counter("courtreserve_watch_requests_total", "Requests spent watching for cancellations", ("acc",))
+BUDGET_DEFERRED = registry.counter("courtreserve_watch_budget_deferred_total", "Polls pushed back because the hourly budget was spent", ("acc",))
+
+PREPARE_COST = 3 # courts view + reservation form + the POST
+FIRE_COST = 1
+
+
+class RequestBudget:
+    # sliding one-hour window of requests per account
+    def __init__(self, limit: int = WATCH_BUDGET, window: float = 3600):
+        self.limit = limit
+        self.window = window
+        self.spent: dict[str, deque] = {}
+        self.lock = Lock()
+
+    def _trim(self, acc: str, now: float) -> deque:
+        spent = self.spent.setdefault(acc, deque())
+        while spent and spent[0] <= now - self.window:
+            spent.popleft()
+        return spent
+
+    def take(self, acc: str, cost: int = 1) -> bool:
+        now = time()
+        with self.lock:
+            spent = self._trim(acc, now)
+            if len(spent) + cost > self.limit:
+                return False
+            spent.extend([now] * cost)
+            return True
+
+    def next_free(self, acc: str, cost: int = 1) -> float:
+        # epoch seconds when `cost` requests fit again
+        now = time()
+        with self.lock:
+            spent = self._trim(acc, now)
+            over = len(spent) + cost - self.limit
+            if over <= 0:
+                return now
+            return spent[min(over, len(spent)) - 1] + self.window
+
+
+budget = RequestBudget()
+
+
+class Watch:
+    # one unfulfilled reservation: its logged-in bot and a booking per candidate, built ahead of time
+    def __init__(self, resbot, candidates: list[Candidate]):
+        self.resbot = resbot
+        self.candidates = list(candidates)
+        self.prepared: dict[Candidate, tuple[float, dict]] = {} # candidate -> (built at, prepared)
+        self.turn = 0
+        self.polls = 0
+
+    def next_candidate(self, now: datetime) -> Candidate:
+        # round-robin over the candidates whose start is still ahead
+        self.candidates = [c for c in self.candidates if c.date > now]
+        if not self.candidates:
+            return None
+        self.turn += 1
+        return self.candidates[(self.turn - 1) % len(self.candidates)]
+
+
+class Watcher:
+    """
+    Keeps hunting for reservations the release burst didn't get, to catch cancellations.
+
+    Each poll re-sends a booking built ahead of time for one of the candidates: the site has no
+    cheap availability endpoint, and the CreateReservation POST is a single small request that books
+    the slot in the same round trip it finds it free. Form tokens are rebuilt when they get old.
+    Polls tighten near the usual cancellation times and every account has an hourly request budget.
+    """
+
+    def __init__(self, logger: Logger, budget: RequestBudget = budget):
+        self.logger = logger
+        self.budget = budget
+        self.watches: dict[str, Watch] = {}
+        self.lock = Lock()
+
+    @staticmethod
+    def interval(now: datetime, start: datetime) -> float:
+        lo, hi = WATCH_INTERVAL
+        until = (start - now).total_seconds()
+        # last-minute drop-outs and the day-before free cancellation deadline
+        if until <= 3 * 3600 or abs(until - 24 * 3600) <= 3600:
+            return lo
+        delay = lo + (hi - lo) * min(until / (48 * 3600), 1)
+        if now.minute >= 55 or now.minute < 5:
+            # people tend to cancel around the hour
+            delay /= 2
+        return max(lo, delay)
+
+    def watch(self, resbot):
+        if resbot.is_reserved:
+            return
+        resbot.checkpoint = None # the window's checkpoint is gone once the burst is over
+        resbot.mode = "watch"
+        candidates = resbot.candidates()
+        resbot.pending = []
+        watch = Watch(resbot, candidates)
+        with self.lock:
+            self.watches[resbot.owner] = watch
+            WATCHED.set(len(self.watches))
+        self.logger.info(f"[{resbot.acc}] Watching {resbot.reservation.date} for cancellations", True)
+        self.schedule(watch, time())
+
+    def stop(self, watch: Watch, reason: str):
+        with self.lock:
+            self.watches.pop(watch.resbot.owner, None)
+            WATCHED.set(len(self.watches))
+        watch.resbot.close()
+        self.logger.info(f"[{watch.resbot.acc}] Stopped watching {watch.resbot.reservation.date}: {reason} ({watch.polls} polls)", True)
+
+    def schedule(self, watch: Watch, at: float):
+        scheduler.submit(self.poll, watch, priority=FALLBACK, account=watch.resbot.acc, at=at)
+
+    def poll(self, watch: Watch):
+        resbot = watch.resbot
+        now = datetime.now(tz=resbot.zone)
+        if self.watches.get(resbot.owner) is not watch:
+            # stopped while this poll was waiting
+            return
+        if resbot.is_reserved:
+            return self.stop(watch, "reserved")
+
+        candidate = watch.next_candidate(now)
+        if candidate is None:
+            return self.stop(watch, "no candidate left")
+
+        built_at, prepared = watch.prepared.get(candidate, (0, None))
+        stale = prepared is None or time() - built_at > WATCH_TOKEN_AGE
+        cost = PREPARE_COST if stale else FIRE_COST
+        if not self.budget.take(resbot.acc, cost):
+            BUDGET_DEFERRED.inc(acc=resbot.acc)
+            return self.schedule(watch, self.budget.next_free(resbot.acc, cost))
+
+        WATCH_REQUESTS.inc(cost, acc=resbot.acc)
+        watch.polls += 1
+        trace = {}
+        try:
+            if stale:
+                prepared = resbot.prepare(candidate.date, candidate.court, trace, candidate)
+                if "request" in prepared:
+                    watch.prepared[candidate] = (time(), prepared)
+
+            resrv = resbot.fire(prepared, trace) if "request" in prepared else prepared
+            if resrv.get("isValid"):
+                resbot.handle_result(candidate.date, candidate.court, None, trace, resrv)
+                return self.stop(watch, "reserved")
+            if "terminated_by_bot" in resrv:
+                # claimed or booked by another of our accounts
+                watch.candidates.remove(candidate)
+                watch.prepared.pop(candidate, None)
+            else:
+                # failures are the normal outcome here: recorded, not notified
+                resbot.record(candidate.date, candidate.court, None, trace, resrv)
+        except Exception:
+            watch.prepared.pop(candidate, None)
+            self.logger.error(format_exc())
+
+        self.schedule(watch, time() + self.interval(now, min(c.date for c in watch.candidates) if watch.candidates else now))
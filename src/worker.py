@@ -1,68 +1,194 @@
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor
 from src.database import Reservation
 from src.logger import Logger
-from src.courtreserve import ReserveBot
-from src.config import START_HOUR
+from src.courtreserve import ReserveBot, prelogin
+from src.scheduler import scheduler, wait_all, HOUSEKEEPING
+from src.config import BURST_WINDOW
+from src.checkpoint import Checkpoint
+from src.slots import SlotClaims
+from src.planner import due, build_plan, minutes, split, reservation_key
+from src.watch import Watcher
+from src.shadow import Shadow
+from src.orgs import OrgProfile, DEFAULT_ORG
+from src.metrics import registry, health
+from src.threads import threads
+from src.transport import suspend_breakers
 from traceback import format_exc
 from time import sleep
 from telebot import TeleBot
 from pytz import timezone
 
 
+NEXT_RUN = registry.gauge("courtreserve_next_run_timestamp", "When the worker fires next (epoch seconds)", ("org",))
+LAST_RUN = registry.gauge("courtreserve_last_run_duration_seconds", "Duration of the last burst", ("org",))
+STAGGER = 10 # seconds of extra prepare lead per shard sharing a release hour with an earlier one
+
+
 class Worker:
-    def __init__(self, bot: TeleBot, logger: Logger):
+    # one shard per club: its own release hour, horizon, claim table and checkpoint
+    def __init__(self, bot: TeleBot, logger: Logger, org: OrgProfile = DEFAULT_ORG, stagger: float = 0):
         self.bot = bot
         self.logger = logger
+        self.org = org
+        self.claims = SlotClaims()
+        self.watcher = Watcher(logger)
+        self.shadow = Shadow(org, logger, bot)
+        # shards released at the same hour wake up one after the other so their prepare phases don't pile up
+        self.lead = timedelta(seconds=25 + stagger)
 
-        self.zone = timezone("UTC")
-        if (now:=datetime.now(tz=self.zone)).hour < START_HOUR:
-            # minus 1 hour because we want to run the worker slightly before the actual time (minutes are 59)
-            self.next_run = now.replace(hour=START_HOUR, minute=0, second=0, microsecond=0) - timedelta(seconds=25)
+        self.zone = timezone(org.time_zone)
+        now = datetime.now(tz=self.zone)
+        window = self.window(now)
+        if window - self.lead <= now < window + BURST_WINDOW:
+            # restarted in the middle of today's window, resume right away
+            self.next_run = now
+        elif now < window:
+            # a bit before the release hour so everything is prepared when it opens
+            self.next_run = window - self.lead
         else:
-            self.next_run = now.replace(hour=START_HOUR, minute=0, second=0, microsecond=0) + timedelta(days=1) - timedelta(seconds=25)
+            self.next_run = window + timedelta(days=1) - self.lead
+
+    @staticmethod
+    def shards(bot: TeleBot, logger: Logger, orgs: list[OrgProfile]) -> list["Worker"]:
+        workers, seen = [], {}
+        for org in orgs:
+            n = seen[org.release_hour] = seen.get(org.release_hour, -1) + 1
+            workers.append(Worker(bot, logger, org, stagger=n * STAGGER))
+        return workers
+
+    def window(self, now: datetime) -> datetime:
+        # start of today's release window
+        return now.replace(hour=self.org.release_hour, minute=0, second=0, microsecond=0)
 
 
     def _worker(self):
         now = datetime.now(tz=self.zone)
         active_resbot = {}
 
-        reservations = Reservation.all()
-        with ThreadPoolExecutor(max_workers=10, thread_name_prefix="account-wise") as executor:
-            for reservation in reservations:
-                bot_instance = active_resbot.get(reservation.acc, None)
-                if bot_instance is None:
-                    resbot = ReserveBot(reservation, self.logger, self.bot)
-                    resbot.additional = 6874076639
-                    bot_instance = active_resbot[reservation.acc] = resbot
-                executor.submit(bot_instance.reserve_worker, now)
-            
-        self.logger.info("reserver bot worker is done", True)
+        window = self.window(now)
+        # the burst retries through errors instead of tripping the breakers
+        suspend_breakers((window + BURST_WINDOW).timestamp())
+        checkpoint = Checkpoint.load(window, f"data/checkpoint-{self.org.org_id}.json")
+        if checkpoint.resumed:
+            self.logger.info(f"Resuming the {window} burst from checkpoint", True)
+
+        reservations, expired = due([r for r in Reservation.all() if (r.org_id or DEFAULT_ORG.org_id) == self.org.org_id], now, self.org)
+        for reservation in expired:
+            Reservation.delete(reservation)
+            self.logger.info(f"Deleted reservation {reservation.date}", True)
+
+        # one pass over every due reservation before anyone fires
+        plan = build_plan(reservations, self.org)
+        self.logger.info(f"[{self.org.name}] {len(reservations)} reservation(s) due, {len(plan)} candidate(s) planned", True)
+
+        # every account is signed in at once, then the bots (one reservations page load each) are built in parallel.
+        # A resume skips the sign-in round: building the bots checks the cached cookies anyway
+        if not checkpoint.resumed:
+            prelogin(self.logger, org=self.org)
+        active_resbot.update(self.build(reservations, checkpoint, plan))
+
+        try:
+            # split the candidate slots between the reservations before anyone fires
+            self.claims.reset()
+            self.claims.assign([(owner, resbot.candidates()) for owner, resbot in active_resbot.items()])
+
+            # everything is queued on the shared scheduler; POSTs wait there for their fire time
+            for resbot in active_resbot.values():
+                resbot.reserve_worker(now)
+
+            missed = [resbot for resbot in active_resbot.values() if resbot.finish()]
+            # a multi-hour booking that missed gets another go as one-hour bookings before anything is watched
+            long = [resbot for resbot in missed if minutes(resbot.reservation) > 60]
+            if long:
+                missed = [resbot for resbot in missed if resbot not in long] + self.split_missed(long, now, active_resbot, checkpoint)
+
+            for resbot in missed:
+                # missed in the burst: keep polling for a cancellation until the slot starts
+                self.watcher.watch(resbot)
+        finally:
+            # the watcher owns (and later closes) the bots it took, the rest are done
+            for owner, resbot in active_resbot.items():
+                if owner not in self.watcher.watches:
+                    resbot.close()
+
+        checkpoint.clear()
+        self.logger.info(f"[{self.org.name}] reserver bot worker is done", True)
         
 
+    def build(self, reservations: list[Reservation], checkpoint: Checkpoint = None, plan=None) -> dict[str, ReserveBot]:
+        # one reservations page load per bot, all in parallel on the scheduler
+        building = [(reservation, scheduler.submit(ReserveBot, reservation, self.logger, self.bot, priority=HOUSEKEEPING, account=reservation.acc)) for reservation in reservations]
+        wait_all([future for _, future in building])
+
+        resbots = {}
+        for reservation, future in building:
+            if future.exception() is not None:
+                self.logger.error(f"[{reservation.acc}] Could not prepare {reservation.date}: {future.exception()}")
+                continue
+            resbot = future.result()
+            resbot.additional = 6874076639
+            resbot.checkpoint = checkpoint
+            resbot.plan = plan
+            resbot.claims = self.claims
+            resbots[resbot.owner] = resbot
+        return resbots
+
+    def split_missed(self, missed: list[ReserveBot], now: datetime, active_resbot: dict, checkpoint: Checkpoint = None) -> list[ReserveBot]:
+        # fires every hour of the missed multi-hour bookings as its own booking, right away; returns the hours that missed too
+        pieces = {}
+        for resbot in missed:
+            # the long booking is over: its court/hours are free for the pieces (and anyone else)
+            self.claims.release(resbot.owner)
+            hours = split(resbot.reservation, self.org)
+            self.logger.info(f"[{resbot.acc}] Missed {resbot.reservation.date} as one {minutes(resbot.reservation)} minute booking, trying {len(hours)} one-hour bookings", True)
+            # every piece stays on its own hour; the checkpoint keeps the won ones across a restart
+            built = self.build(hours, checkpoint, build_plan(hours, self.org, keep_start=True))
+            active_resbot.update(built)
+            pieces[resbot] = (hours, list(built.values()))
+
+        everything = [piece for _, built in pieces.values() for piece in built]
+        self.claims.assign([(piece.owner, piece.candidates()) for piece in everything])
+        for piece in everything:
+            piece.reserve_worker(now)
+        missed_hours = [piece for piece in everything if piece.finish()]
+
+        for resbot, (hours, built) in pieces.items():
+            # the long row is replaced by the hours still to get, so they're watched and expire on their own
+            won = {piece.owner for piece in built if piece.is_reserved}
+            for hour in hours:
+                if reservation_key(hour) not in won:
+                    Reservation.add(hour)
+            Reservation.delete(resbot.reservation)
+        return missed_hours
+
     def worker(self):
+        started = datetime.now(tz=self.zone)
         try:
             self._worker()
         except Exception:
             self.logger.error(format_exc())
+        LAST_RUN.set((datetime.now(tz=self.zone) - started).total_seconds(), org=self.org.org_id)
 
 
     def run(self, non_blocking=True):
-        # run worker every day at 11:00:00 UTC; only once a day
+        self.shadow.start()
+        # run worker every day just before the org's release hour; only once a day
         def _func():
-            self.logger.info(f"Next run at {self.next_run} i.e. after {self.next_run - datetime.now(tz=self.zone)}", True)
+            self.logger.info(f"[{self.org.name}] Next run at {self.next_run} i.e. after {self.next_run - datetime.now(tz=self.zone)}", True)
+            NEXT_RUN.set(self.next_run.timestamp(), org=self.org.org_id)
             while True:
                 if datetime.now(tz=self.zone) >= self.next_run:
-                    self.logger.info("reserver bot worker is running...", True)
+                    self.logger.info(f"[{self.org.name}] reserver bot worker is running...", True)
                     self.worker()
-                    self.next_run = datetime.now(tz=self.zone).replace(hour=START_HOUR-1, minute=59, second=45, microsecond=0) + timedelta(days=1)
-                    self.logger.info(f"Next run at {self.next_run}", True)
+                    self.next_run = self.window(datetime.now(tz=self.zone)) + timedelta(days=1) - self.lead
+                    self.logger.info(f"[{self.org.name}] Next run at {self.next_run}", True)
+                    NEXT_RUN.set(self.next_run.timestamp(), org=self.org.org_id)
 
                 sleep(0.01)
         
         if non_blocking:
-            from threading import Thread
-            Thread(target=_func, daemon=True, name="main-worker-thread").start()
+            self.thread = threads.spawn(_func, name=f"worker-{self.org.org_id}")
+            health.register(f"worker-{self.org.org_id}", self.thread.is_alive, live=True)
         else:
             _func()
 
@@ -1,10 +1,32 @@
 #!/bin/bash
 
 bot(){
-    python3 main.py
+    python3 main.py &
+    pid=$!
+
+    # kill the bot if /healthz stops answering 3 times in a row, the loop below restarts it
+    (
+        sleep 60
+        failures=0
+        while kill -0 $pid 2>/dev/null; do
+            if python3 -c "import urllib.request; urllib.request.urlopen('http://127.0.0.1:9100/healthz', timeout=5)" 2>/dev/null; then
+                failures=0
+            else
+                failures=$((failures+1))
+            fi
+            if [ $failures -ge 3 ]; then
+                echo "'main.py' is unhealthy. Killing it..." >&2
+                kill $pid
+                break
+            fi
+            sleep 30
+        done
+    ) &
+
+    wait $pid
 }
 
 until bot; do
     echo "'main.py' crashed with exit code $?. Restarting..." >&2
     sleep 1
-done
\ No newline at end of file
+done